@@ -0,0 +1,214 @@
+#Perft and speed benchmarks for move generation and search on a fixed corpus of positions
+#   python benchmark.py --output bench.json                 run and save the results
+#   python benchmark.py --compare bench.json                run and compare against an earlier run
+#Perft counts double as a correctness check: the C++ counts are compared with board.Board's, and both engines must
+#reject the same invalid move codes
+import argparse
+import json
+import platform
+import time
+import warnings
+
+from board import Board
+import bot_cpp
+with warnings.catch_warnings(): #python_engine warns that it is slow, which is what is being measured here
+    warnings.simplefilter("ignore")
+    import python_engine
+
+#Positions are move sequences from the starting position, replayed through board.Board so they are always legal
+CORPUS = {
+    "opening": [],
+    "midgame_walls": [(7, 4), (1, 4), (3, 3, "H"), (6, 3, "H"), (6, 4), (2, 4), (3, 5, "V"), (5, 2, "V"),
+                      (4, 1, "H"), (5, 5, "H"), (6, 5), (2, 6, "H"), (2, 1, "V"), (4, 6, "V"), (5, 5), (2, 5)],
+    "jump": [(7, 4), (1, 4), (6, 4), (2, 4), (5, 4), (3, 4), (4, 4)], #player 2 can jump straight over player 1
+    "diagonal": [(7, 4), (1, 4), (6, 4), (2, 4), (5, 4), (3, 4), (4, 4), (3, 4, "H")], #jump blocked so diagonals
+    "no_walls_left": [(r, c, "H") for r in range(2, 7) for c in range(0, 8, 2)], #pawn moves only
+}
+
+def corpus_board(name):
+    board = Board()
+    for move in CORPUS[name]:
+        board.apply_move(move)
+    return board
+
+def python_perft(board, depth):
+    #leaf positions depth plies ahead using board.Board. A won position is a leaf
+    if depth == 0 or board.game_over:
+        return 1
+
+    moves = board.legal_pawn_moves() + board.legal_wall_moves()
+    if depth == 1:
+        return len(moves)
+
+    nodes = 0
+    for move in moves:
+        child = board.copy()
+        child.apply_move(move)
+        nodes += python_perft(child, depth - 1)
+    return nodes
+
+def time_python_movegen(board, iterations):
+    #seconds per full legal move generation with board.Board, from a fresh copy so the path cache starts cold
+    copies = [board.copy() for _ in range(iterations)]
+    for copy in copies:
+        copy._path_cache = None #copies share the cache, so drop it
+    start = time.perf_counter()
+    for copy in copies:
+        copy.legal_pawn_moves()
+        copy.legal_wall_moves()
+    return (time.perf_counter() - start) / iterations
+
+def run_benchmarks(perft_depth, python_perft_depth, search_depths, iterations, python_iterations, python_search_depth):
+    results = {
+        "python": platform.python_version(),
+        "settings": {"perft_depth": perft_depth, "python_perft_depth": python_perft_depth,
+                     "search_depths": search_depths, "iterations": iterations, "python_search_depth": python_search_depth},
+        "positions": {},
+    }
+
+    for name in CORPUS:
+        board = corpus_board(name)
+        state = board.export_state_for_bot()
+        position = {"perft": {}, "perft_seconds": {}, "python_perft": {}, "perft_match": True}
+
+        #Perft, checked against board.Board where that is fast enough
+        for depth in range(1, perft_depth + 1):
+            start = time.perf_counter()
+            position["perft"][str(depth)] = bot_cpp.perft(*state, depth)
+            position["perft_seconds"][str(depth)] = time.perf_counter() - start
+
+        for depth in range(1, python_perft_depth + 1):
+            position["python_perft"][str(depth)] = python_perft(board, depth)
+            cpp_nodes = position["perft"].get(str(depth))
+            if cpp_nodes is not None and cpp_nodes != position["python_perft"][str(depth)]:
+                position["perft_match"] = False
+
+        #Move generation throughput (calls per second)
+        seconds = bot_cpp.benchmark_movegen(*state, iterations)
+        position["movegen_per_s"] = {key: 1 / value for key, value in seconds.items() if key != "checksum" and value > 0}
+        position["movegen_per_s"]["python_legal_moves"] = 1 / time_python_movegen(board, python_iterations)
+
+        #Fixed depth searches from an empty transposition table
+        position["search"] = {}
+        for depth in search_depths:
+            move, stats = bot_cpp.benchmark_search(*state, depth)
+            position["search"][str(depth)] = {
+                "move": list(move),
+                "score": stats.score,
+                "nodes": stats.nodes,
+                "seconds": stats.seconds,
+                "nodes_per_s": stats.nodes_per_second,
+                "leaf_evaluations": stats.leaf_evaluations,
+                "bfs_calls": stats.bfs_calls,
+                "beta_cutoffs": stats.beta_cutoffs,
+                "principal_variation": [list(pv_move) for pv_move in stats.principal_variation],
+            }
+
+        #The same searches with the pure Python fallback engine, to show what running without bot_cpp costs
+        position["python_search"] = {}
+        for depth in search_depths:
+            if depth > python_search_depth:
+                continue
+            python_engine.clear_tt()
+            move, stats = python_engine.bot_main(*state, depth, return_stats=True)
+            position["python_search"][str(depth)] = {"move": list(move), "nodes": stats.nodes, "seconds": stats.seconds}
+
+        results["positions"][name] = position
+    return results
+
+def print_results(results):
+    for name, position in results["positions"].items():
+        match = "ok" if position["perft_match"] else "MISMATCH WITH board.py"
+        perft = ", ".join(f"d{depth}={nodes}" for depth, nodes in position["perft"].items())
+        print(f"{name}")
+        print(f"  perft: {perft}  ({match})")
+        rates = ", ".join(f"{key} {value:,.0f}/s" for key, value in position["movegen_per_s"].items())
+        print(f"  movegen: {rates}")
+        for depth, search in position["search"].items():
+            print(f"  search d{depth}: {search['nodes']} nodes in {1000 * search['seconds']:.1f} ms "
+                  f"({search['nodes_per_s']:,.0f} nodes/s, {search['bfs_calls']} BFS), best {tuple(search['move'])}")
+        for depth, search in position.get("python_search", {}).items():
+            native_seconds = position["search"][depth]["seconds"]
+            slower = f"{search['seconds'] / native_seconds:.0f}x slower" if native_seconds > 0 else "n/a"
+            print(f"  python engine d{depth}: {search['nodes']} nodes in {1000 * search['seconds']:.1f} ms ({slower}), "
+                  f"best {tuple(search['move'])}")
+
+#Move codes neither engine may play from the starting position: out of range and pawn moves to squares not next to it
+INVALID_MOVE_CODES = [-1, 209, 300, 1000, 4, 80]
+
+def check_invalid_moves():
+    #names of the engines that accept one of INVALID_MOVE_CODES
+    accepted = []
+    for name, engine_class in [("bot_cpp", bot_cpp.Engine), ("python_engine", python_engine.Engine)]:
+        for code in INVALID_MOVE_CODES:
+            engine = engine_class(1)
+            try:
+                engine.push(code)
+                accepted.append(f"{name} {code}")
+            except ValueError:
+                pass
+    return accepted
+
+def compare_results(old, new):
+    #print the change of every speed metric and flag perft counts that differ (a move generation change)
+    problems = 0
+    for name, position in new["positions"].items():
+        if name not in old["positions"]:
+            continue
+        before = old["positions"][name]
+        print(f"{name}")
+
+        for depth, nodes in position["perft"].items():
+            if depth in before["perft"] and before["perft"][depth] != nodes:
+                print(f"  perft d{depth} changed: {before['perft'][depth]} -> {nodes}")
+                problems += 1
+
+        for key, rate in position["movegen_per_s"].items():
+            if key in before["movegen_per_s"]:
+                print(f"  {key}: {rate / before['movegen_per_s'][key]:.2f}x")
+
+        for depth, search in position["search"].items():
+            if depth in before["search"]:
+                old_search = before["search"][depth]
+                speedup = old_search["seconds"] / search["seconds"] if search["seconds"] > 0 else float("inf")
+                print(f"  search d{depth}: nodes {old_search['nodes']} -> {search['nodes']}, "
+                      f"time {speedup:.2f}x faster, nodes/s {search['nodes_per_s'] / old_search['nodes_per_s']:.2f}x")
+                if old_search["move"] != search["move"]:
+                    print(f"    best move changed: {tuple(old_search['move'])} -> {tuple(search['move'])}")
+    return problems
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark move generation and search on a fixed set of positions")
+    parser.add_argument("--perft-depth", type=int, default=3)
+    parser.add_argument("--python-perft-depth", type=int, default=2, help="depth checked against board.Board")
+    parser.add_argument("--search-depths", type=int, nargs="+", default=[1, 2, 3])
+    parser.add_argument("--iterations", type=int, default=2000, help="calls per C++ move generation timing")
+    parser.add_argument("--python-iterations", type=int, default=20, help="calls per board.Board timing")
+    parser.add_argument("--python-search-depth", type=int, default=2, help="deepest search timed with python_engine")
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    parser.add_argument("--compare", help="JSON results of an earlier run to compare against")
+    args = parser.parse_args()
+
+    results = run_benchmarks(args.perft_depth, args.python_perft_depth, args.search_depths,
+                             args.iterations, args.python_iterations, args.python_search_depth)
+    print_results(results)
+
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(results, file, indent=2)
+
+    failed = not all(position["perft_match"] for position in results["positions"].values())
+    accepted = check_invalid_moves()
+    print(f"\nInvalid move codes: {'accepted by ' + ', '.join(accepted) if accepted else 'rejected by both engines'}")
+    failed = failed or bool(accepted)
+    if args.compare:
+        with open(args.compare) as file:
+            old = json.load(file)
+        print(f"\nCompared with {args.compare}")
+        failed = compare_results(old, results) > 0 or failed
+
+    if failed:
+        raise SystemExit(1)
+
+if __name__ == "__main__":
+    main()
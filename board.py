@@ -1,77 +1,125 @@
-class Queue:
-    #needed for the BFS
-    def __init__(self):
-        self.queue = []
-        self.head = 0
-
-    def add(self, item):
-        self.queue.append(item)
-
-    def remove(self):
-        item = self.queue[self.head]
-        self.head += 1
-        return item
-
-    def is_empty(self):
-        return self.head >= len(self.queue)
+#Compact integer move codes, used by the opening book
+#0-80: pawn move to row*9 + col. 81-208: wall, 81 + 64*type + (row-1)*8 + col with type 0 for "H" and 1 for "V"
+def encode_move(move):
+    if len(move) == 2:
+        row, col = move
+        return row * 9 + col
+    row, col, orientation = move
+    return 81 + (0 if orientation == "H" else 64) + (row - 1) * 8 + col
+
+def decode_move(code):
+    #raises ValueError for a code outside 0-208, like bot_cpp
+    if not 0 <= code <= 208:
+        raise ValueError(f"Invalid move code: {code}")
+    if code < 81:
+        return (code // 9, code % 9)
+    code -= 81
+    orientation = "H" if code < 64 else "V"
+    code %= 64
+    return (code // 8 + 1, code % 8, orientation)
+
+#Precomputed board geometry. Squares are numbered row*9 + col and the edge leaving a square in a direction is square*4 + direction
+DIRECTIONS = [(-1, 0), (1, 0), (0, -1), (0, 1)] #up, down, left, right - so direction ^ 1 is the opposite direction
+DIRECTION_INDEX = {step: direction for direction, step in enumerate(DIRECTIONS)}
+PERPENDICULAR = [(2, 3), (3, 2), (0, 1), (1, 0)] #diagonal directions tried when a jump is blocked (same order as before)
+SQUARES = [(row, col) for row in range(9) for col in range(9)]
+
+#STEP[edge]: the square the edge leads to, -1 if it leaves the board
+STEP = []
+for row, col in SQUARES:
+    for dx, dy in DIRECTIONS:
+        new_row, new_col = row + dx, col + dy
+        STEP.append(new_row * 9 + new_col if 0 <= new_row < 9 and 0 <= new_col < 9 else -1)
+
+#NEIGHBOURS[square]: (edge, adjacent square, direction) for every direction that stays on the board
+NEIGHBOURS = [[(square * 4 + direction, STEP[square * 4 + direction], direction) for direction in range(4) if STEP[square * 4 + direction] >= 0]
+              for square in range(81)]
+
+#Every wall position that can be on the board, in the order legal_wall_moves lists them
+WALL_POSITIONS = [(row, col, orientation) for row in range(1, 9) for col in range(8) for orientation in ["H", "V"]]
+
+#WALL_EDGES[wall]: the edges (both directions) a wall cuts. "H" at (r, c) cuts the steps between rows r-1 and r in columns c and c+1,
+#"V" at (r, c) cuts the steps between columns c and c+1 in rows r-1 and r (mirrors the old is_blocked)
+#WALL_CONFLICTS[wall]: walls that overlap or cross it, including itself
+WALL_EDGES = {}
+WALL_CONFLICTS = {}
+for row in range(1, 9):
+    for col in range(8):
+        edges = []
+        for offset in range(2):
+            above, below = (row - 1) * 9 + col + offset, row * 9 + col + offset
+            edges += [above * 4 + 1, below * 4 + 0]
+        WALL_EDGES[(row, col, "H")] = tuple(edges)
+        WALL_CONFLICTS[(row, col, "H")] = ((row, col, "H"), (row, col, "V"), (row, col + 1, "H"), (row, col - 1, "H"))
+
+        edges = []
+        for offset in range(2):
+            left, right = (row - offset) * 9 + col, (row - offset) * 9 + col + 1
+            edges += [left * 4 + 3, right * 4 + 2]
+        WALL_EDGES[(row, col, "V")] = tuple(edges)
+        WALL_CONFLICTS[(row, col, "V")] = ((row, col, "V"), (row, col, "H"), (row + 1, col, "V"), (row - 1, col, "V"))
 
 class Board:
+    __slots__ = ("pawns", "walls", "walls_remaining", "current_player", "game_over", "winner", "_blocked", "_path_cache", "recorder")
+
     def __init__(self):
         self.pawns = [(8, 4), (0, 4)] #storing the pawns as a list of tuples with row col (row number increases going down by convention)
         # Coordinates stored as row col tuple. Board size 9x9.
         self.walls = set() #collection of walls stored as a set (hash set) of tuples
-        #Each wall will be stored as a tuple e.g ('H', (r, c))
+        #Each wall will be stored as a tuple e.g (r, c, "H")
         self.walls_remaining = [10, 10]
         self.current_player = 0
         self.game_over = False
         self.winner = None
+        self._blocked = bytearray(81 * 4) #number of walls cutting each edge, kept in step with walls
+        self._path_cache = None #(position key, walls that cut a shortest path) - see path_blockers
+        self.recorder = None #game_record.GameWriter that is passed every move, if the game is being recorded
     
+    def copy(self):
+        #independent copy of the position. The path cache is shared: it is only ever replaced, and its key
+        #stops matching as soon as either board changes
+        new_board = Board.__new__(Board)
+        new_board.pawns = list(self.pawns)
+        new_board.walls = set(self.walls)
+        new_board.walls_remaining = list(self.walls_remaining)
+        new_board.current_player = self.current_player
+        new_board.game_over = self.game_over
+        new_board.winner = self.winner
+        new_board._blocked = bytearray(self._blocked)
+        new_board._path_cache = self._path_cache
+        new_board.recorder = None #copies are for looking ahead, only the real game is recorded
+        return new_board
+
     def switch_turn(self):
         #change the current turn between 0 and 1
         self.current_player = 1 - self.current_player
 
     def legal_pawn_moves(self):
         #return a list of all the legal pawn moves
-        moves = []
-        current_position = self.pawns[self.current_player]
-        for square in self.neighbouring_squares(current_position):
-            moves.append(square) #notation for a move is ("PAWN", (row, col)) or ("WALL", "H", (row, col))
-        return moves
+        row, col = self.pawns[self.current_player]
+        return [SQUARES[square] for square in self._neighbours(row * 9 + col)]
 
     def is_legal_wall(self, wall):
-        if wall in self.walls:
+        #walls cannot hang off edge of board, overlap a wall of the same type or cross one to form a plus shape
+        conflicts = WALL_CONFLICTS.get(wall)
+        if conflicts is None:
             return False
-
-        r, c, orientation = wall
-
-        #walls cannot hang off edge of board
-        if orientation == "H":
-            if c < 0 or c > 7 or r < 1 or r > 8:
-                return False  # prevents hanging off left/right
-        else:  # "V"
-            if r < 1 or r > 8 or c < 0 or c > 7:
-                return False  # prevents hanging off top/bottom
-
-        #horizontal and vertical walls cannont intersect to form a plus shape
-        if orientation == "H":
-            # check for vertical intersection (prevent "+" overlap)
-            if (r, c, "V") in self.walls:
-                return False
-        else:  # vertical
-            if (r, c, "H") in self.walls:  # blocks intersection
+        walls = self.walls
+        for other in conflicts:
+            if other in walls:
                 return False
 
-        #prevent overlaps of walls of same type
-        if orientation == "H":
-            if (r, c+1, "H") in self.walls or (r, c-1, "H") in self.walls:
-                return False  # prevents overlapping / inside
-        else:  # "V"
-            if (r+1, c, "V") in self.walls or (r-1, c, "V") in self.walls:
-                return False  # prevents overlapping / inside
+        blockers = self.path_blockers()
+        if blockers is not None and wall not in blockers:
+            return True #both players' current shortest paths survive this wall so it cant trap anyone
 
-        self.walls.add(wall) #add the wall so that we can then check if its ok
+        blocked = self._blocked
+        edges = WALL_EDGES[wall]
+        for edge in edges: #cut the edges so that we can then check if its ok
+            blocked[edge] += 1
         legal = (self.path_exists(0) and self.path_exists(1)) #a path must exist for both player 0 and player 1
-        self.walls.remove(wall) #undo the wall placement
+        for edge in edges: #undo the wall placement
+            blocked[edge] -= 1
 
         return legal
 
@@ -79,14 +127,7 @@ class Board:
         #return a list of all the legal wall moves
         if self.walls_remaining[self.current_player] == 0:
             return []
-
-        moves = []
-        for row in range(8):
-            for col in range(8):
-                for orientation in ["H", "V"]:
-                    if self.is_legal_wall((row, col, orientation)):
-                        moves.append((row, col, orientation))
-        return moves
+        return [wall for wall in WALL_POSITIONS if self.is_legal_wall(wall)]
 
     def apply_pawn_move(self, position):
         if position not in self.legal_pawn_moves():
@@ -94,10 +135,13 @@ class Board:
         self.pawns[self.current_player] = position
 
     def apply_wall_move(self, wall):
-        if not self.is_legal_wall(wall) or self.walls_remaining[self.current_player] == 0:
+        if self.walls_remaining[self.current_player] == 0 or not self.is_legal_wall(wall):
             raise ValueError(f"Illegal wall move: {wall}")
 
         self.walls.add(wall)
+        blocked = self._blocked
+        for edge in WALL_EDGES[wall]:
+            blocked[edge] += 1
         self.walls_remaining[self.current_player] -= 1
 
     def apply_move(self, move):
@@ -117,6 +161,8 @@ class Board:
         else:
             self.switch_turn()
 
+        if self.recorder is not None:
+            self.recorder.record_move(self, move)
         return True
 
     def is_valid_location(self, location):
@@ -126,42 +172,37 @@ class Board:
     def neighbouring_squares(self, square):
         #give the 4 possible squares unless blocked by wall, and account for special pawn moves
         row, col = square
+        return [SQUARES[neighbour] for neighbour in self._neighbours(row * 9 + col)]
+
+    def _neighbours(self, square):
+        #neighbouring_squares on square numbers, the inner loop of every BFS
+        blocked = self._blocked
+        (row_a, col_a), (row_b, col_b) = self.pawns
+        pawn_a = row_a * 9 + col_a
+        pawn_b = row_b * 9 + col_b
         neighbours = []
-        for dx, dy in [(-1, 0), (1, 0), (0, -1), (0, 1)]:
-            new_row = row + dx
-            new_col = col + dy
-            adjacent = (new_row, new_col)
-            
-            #Check if adjacent square is valid and not blocked by wall
-            if not self.is_valid_location(adjacent) or self.is_blocked(square, adjacent):
+        for edge, adjacent, direction in NEIGHBOURS[square]:
+            if blocked[edge]:
                 continue
-            
+
             #Check if theres a pawn on the adjacent square
-            if adjacent not in self.pawns:
+            if adjacent != pawn_a and adjacent != pawn_b:
                 #No pawn - normal move
                 neighbours.append(adjacent)
+                continue
+
+            #Try to jump over the pawn
+            jump_edge = adjacent * 4 + direction
+            jump_square = STEP[jump_edge]
+            if jump_square >= 0 and not blocked[jump_edge]:
+                neighbours.append(jump_square)
             else:
-                #Theres a pawn on the adjacent square
-                jump_row = new_row + dx
-                jump_col = new_col + dy
-                jump_square = (jump_row, jump_col)
-                
-                #Try to jump over the opponent
-                if self.is_valid_location(jump_square) and not self.is_blocked(adjacent, jump_square):
-                    neighbours.append(jump_square)
-                else:
-                    #Cant jump - blocked by wall or edge so try diagonal moves
-                    #Diagonal moves are perpendicular to the original direction
-                    for perp_dx, perp_dy in [(dy, dx), (-dy, -dx)]:
-                        diag_row = new_row + perp_dx
-                        diag_col = new_col + perp_dy
-                        diag_square = (diag_row, diag_col)
-                        
-                        #Check if diagonal square is valid and not blocked from opponents position
-                        if (self.is_valid_location(diag_square) and 
-                            not self.is_blocked(adjacent, diag_square)):
-                            neighbours.append(diag_square)
-            
+                #Cant jump - blocked by wall or edge so try the diagonal moves, perpendicular to the original direction
+                for perpendicular in PERPENDICULAR[direction]:
+                    diagonal_edge = adjacent * 4 + perpendicular
+                    diagonal_square = STEP[diagonal_edge]
+                    if diagonal_square >= 0 and not blocked[diagonal_edge]:
+                        neighbours.append(diagonal_square)
         return neighbours
 
     def is_winner(self, player):
@@ -176,40 +217,100 @@ class Board:
         #is the path from point a to b (adjacent squares) blocked? a,b are row col tuples
         r1, c1 = a
         r2, c2 = b
-
-        if c1 == c2: #the movement is vertical
-            lower_row = max(r1, r2)
-            if (lower_row, c1, "H") in self.walls or (lower_row, c1-1, "H") in self.walls:
-                return True #the path of this vertical movement is blocked
-
-        if r1 == r2: #the movement is horizontal
-            leftmost_col = min(c1, c2)
-            if (r1, leftmost_col, "V") in self.walls or (r1+1, leftmost_col, "V") in self.walls:
-                return True
-
-        return False #the path is not blocked
+        direction = DIRECTION_INDEX.get((r2 - r1, c2 - c1))
+        if direction is None:
+            return False #not adjacent
+        if self.is_valid_location(a):
+            return self._blocked[(r1 * 9 + c1) * 4 + direction] > 0
+        if self.is_valid_location(b):
+            return self._blocked[(r2 * 9 + c2) * 4 + (direction ^ 1)] > 0
+        return False
 
     def path_exists(self, player):
         #determine if a path to the end exists for {player} using BFS
-        start_node = self.pawns[player]
-        queue = Queue()
-        visited = set()
-        queue.add(start_node)
-
-        while not queue.is_empty():
-            position = queue.remove()
-            row, col = position
-            if player == 0 and row == 0:
-                return True
-            if player == 1 and row == 8:
+        row, col = self.pawns[player]
+        start = row * 9 + col
+        low, high = (0, 9) if player == 0 else (72, 81) #square numbers of the goal row
+        visited = bytearray(81)
+        visited[start] = 1
+        queue = [start]
+
+        for square in queue: #the queue grows while it is walked, which makes this a BFS
+            if low <= square < high:
                 return True
+            for neighbour in self._neighbours(square):
+                if not visited[neighbour]:
+                    visited[neighbour] = 1
+                    queue.append(neighbour)
+        return None
 
-            for neighbour in self.neighbouring_squares(position):
-                if neighbour not in visited:
-                    queue.add(neighbour)
-                    visited.add(neighbour)
+    def shortest_path(self, player):
+        #list of squares on a shortest path for {player} (starting at their pawn) using BFS, None if there is no path
+        row, col = self.pawns[player]
+        start = row * 9 + col
+        low, high = (0, 9) if player == 0 else (72, 81)
+        parents = [-2] * 81 #-2 unvisited, -1 the start
+        parents[start] = -1
+        queue = [start]
+
+        for square in queue:
+            if low <= square < high:
+                path = []
+                while square >= 0:
+                    path.append(SQUARES[square])
+                    square = parents[square]
+                return path[::-1]
+
+            for neighbour in self._neighbours(square):
+                if parents[neighbour] == -2:
+                    parents[neighbour] = square
+                    queue.append(neighbour)
         return None
+
+    def step_blockers(self, a, b):
+        #the walls that would block a single step between adjacent squares a and b (mirrors is_blocked)
+        r1, c1 = a
+        r2, c2 = b
+        if c1 == c2:
+            lower_row = max(r1, r2)
+            return [(lower_row, c1, "H"), (lower_row, c1-1, "H")]
+        leftmost_col = min(c1, c2)
+        return [(r1, leftmost_col, "V"), (r1+1, leftmost_col, "V")]
+
+    def path_blockers(self):
+        #set of walls that would cut a step of either player's current shortest path, None if a player has no path
+        #any other legal-looking wall leaves both paths intact so it needs no BFS. Cached until the position changes
+        key = (self.pawns[0], self.pawns[1], len(self.walls))
+        if self._path_cache is not None and self._path_cache[0] == key:
+            return self._path_cache[1]
+
+        blockers = set()
+        for player in range(2):
+            path = self.shortest_path(player)
+            if path is None:
+                blockers = None
+                break
+
+            for a, b in zip(path, path[1:]):
+                if abs(a[0] - b[0]) + abs(a[1] - b[1]) == 1:
+                    blockers.update(self.step_blockers(a, b))
+                else:
+                    #jump or diagonal - the path steps onto the jumped pawn's square and off it again
+                    for pawn in self.pawns:
+                        if abs(a[0] - pawn[0]) + abs(a[1] - pawn[1]) == 1 and abs(pawn[0] - b[0]) + abs(pawn[1] - b[1]) == 1:
+                            blockers.update(self.step_blockers(a, pawn))
+                            blockers.update(self.step_blockers(pawn, b))
+
+        self._path_cache = (key, blockers)
+        return blockers
     
+    def wall_bitmaps(self):
+        #walls as two 64 bit masks (H, V) with wall (r, c) at bit (r-1)*8 + c, the layout bot_cpp uses internally
+        bitmaps = [0, 0]
+        for r, c, orientation in self.walls:
+            bitmaps[0 if orientation == "H" else 1] |= 1 << ((r - 1) * 8 + c)
+        return tuple(bitmaps)
+
     def export_state_for_bot(self):
         #export the board state in a format suitable for the bot
 
@@ -222,4 +323,11 @@ class Board:
         )
         return state
 
-
+def export_batch(boards):
+    #many positions as the NumPy arrays taken by bot_cpp.evaluate_batch: (pawns, walls, walls_remaining, current_player)
+    import numpy as np #only needed for batches, the game itself runs without NumPy
+    pawns = np.array([board.pawns for board in boards], dtype=np.int32).reshape(-1, 2, 2)
+    walls = np.array([board.wall_bitmaps() for board in boards], dtype=np.uint64).reshape(-1, 2)
+    walls_remaining = np.array([board.walls_remaining for board in boards], dtype=np.int32).reshape(-1, 2)
+    current_player = np.array([board.current_player for board in boards], dtype=np.int32)
+    return pawns, walls, walls_remaining, current_player
@@ -1,18 +1,47 @@
 #include <pybind11/pybind11.h>
 #include <pybind11/stl.h>
+#include <pybind11/numpy.h>
 #include <iostream>
 #include <vector>
-#include <queue>
 #include <cmath>
 #include <algorithm>
-#include <unordered_set>
+#include <cstdint>
+#include <chrono>
+#include <atomic>
+#include <cstring>
+#include <memory>
+#include <mutex>
+#include <thread>
+#include <stdexcept>
+#if defined(_MSC_VER)
+#include <intrin.h>
+#endif
 
 namespace py = pybind11;
 
+//Profiling counters for SearchStats. Build with -DBOT_NO_STATS to compile them out of production builds
+#ifdef BOT_NO_STATS
+#define COUNT_STAT(counter) ((void)0)
+#else
+#define COUNT_STAT(counter) (++(counter))
+#endif
+
+//Counters for work done inside Board, which has no access to the search. One set per thread
+struct BoardCounters {
+    uint64_t bfs_calls = 0;
+    uint64_t walls_without_bfs = 0; //wall moves proven legal from the cached paths
+};
+
+thread_local BoardCounters board_counters;
+
 struct Move {
     int row;
     int col;
     char type; //0 for H, 1 for V or 2 for P
+
+    bool operator==(const Move& other) const {
+        return (row == other.row && col == other.col && type == other.type);
+    }
 };
 
 struct Square {
@@ -24,12 +53,6 @@ struct Square {
     }
 };
 
-struct SquareHash {
-    std::size_t operator()(const Square& s) const {
-        return s.row * 9 + s.col;
-    }
-};
-
 struct Wall {
     int row;
     int col;
@@ -40,19 +63,185 @@ struct Wall {
     }
 };
 
-struct WallHash {
-    std::size_t operator()(const Wall& w) const {
-        return (w.row * 9 + w.col) * 2 + w.type;
+//Bitboard layout
+//Squares are indexed row*9 + col (0..80).
+//Walls are anchored on the 8x8 grid of wall intersections. A wall (r, c) with r in 1..8 and c in 0..7
+//maps to bit (r-1)*8 + c of a 64 bit mask, with one mask per wall type.
+enum Direction {UP = 0, DOWN = 1, LEFT = 2, RIGHT = 3};
+const int DIRECTIONS[4][2] = {{-1, 0}, {1, 0}, {0, -1}, {0, 1}};
+const int DIRECTION_WALL_TYPE[4] = {0, 0, 1, 1}; //vertical steps are blocked by H walls, horizontal by V
+
+inline int lowest_bit(uint64_t bits) {
+#if defined(_MSC_VER)
+    unsigned long index;
+    _BitScanForward64(&index, bits);
+    return static_cast<int>(index);
+#else
+    return __builtin_ctzll(bits);
+#endif
+}
+
+inline int square_index(Square square) {return square.row * 9 + square.col;}
+inline Square index_square(int index) {return {index / 9, index % 9};}
+
+inline bool wall_on_grid(int row, int col) {return (row >= 1 && row <= 8 && col >= 0 && col <= 7);}
+inline int wall_index(int row, int col) {return (row - 1) * 8 + col;}
+inline uint64_t wall_bit(int row, int col) {return wall_on_grid(row, col) ? (1ULL << wall_index(row, col)) : 0;}
+
+//Compact integer move codes, the same as board.encode_move: 0-80 pawn move to row*9 + col, walls 81 + 64*type + (row-1)*8 + col
+int encode_move(Move move) {
+    if (move.type == 2) {return move.row * 9 + move.col;}
+    return 81 + 64 * move.type + wall_index(move.row, move.col);
+}
+
+Move decode_move(int code) {
+    if (code < 0 || code > 208) {throw std::invalid_argument("Invalid move code: " + std::to_string(code));}
+    if (code < 81) {return {code / 9, code % 9, 2};}
+    code -= 81;
+    return {(code % 64) / 8 + 1, code % 8, static_cast<char>(code / 64)};
+}
+
+//Precomputed lookup tables shared by every board
+struct Tables {
+    int neighbour[81][4];       //square reached by stepping in each direction, -1 if off the board
+    uint64_t blockers[81][4];   //walls (of the type given by DIRECTION_WALL_TYPE) that block each step
+    uint64_t conflicts[2][64][2]; //[type][wall][other type] walls that make a placement illegal
+    uint64_t nearby[81][2];     //[square][type] walls that block a step from the square or any square next to it
+
+    Tables() {
+        for (int index = 0; index < 81; index++) {
+            Square square = index_square(index);
+            int r = square.row; int c = square.col;
+
+            for (int d = 0; d < 4; d++) {
+                int new_row = r + DIRECTIONS[d][0];
+                int new_col = c + DIRECTIONS[d][1];
+                bool valid = (new_row >= 0 && new_row < 9 && new_col >= 0 && new_col < 9);
+                neighbour[index][d] = valid ? new_row * 9 + new_col : -1;
+            }
+
+            //vertical movement is blocked by horizontal walls on the lower row
+            blockers[index][UP] = wall_bit(r, c) | wall_bit(r, c-1);
+            blockers[index][DOWN] = wall_bit(r+1, c) | wall_bit(r+1, c-1);
+            //horizontal movement is blocked by vertical walls left of the rightmost column
+            blockers[index][LEFT] = wall_bit(r, c-1) | wall_bit(r+1, c-1);
+            blockers[index][RIGHT] = wall_bit(r, c) | wall_bit(r+1, c);
+        }
+
+        for (int r = 1; r <= 8; r++) {
+            for (int c = 0; c <= 7; c++) {
+                int index = wall_index(r, c);
+                //Horizontal: itself, the overlapping horizontals either side and the crossing vertical
+                conflicts[0][index][0] = wall_bit(r, c) | wall_bit(r, c-1) | wall_bit(r, c+1);
+                conflicts[0][index][1] = wall_bit(r, c);
+                //Vertical: itself, the overlapping verticals above and below and the crossing horizontal
+                conflicts[1][index][1] = wall_bit(r, c) | wall_bit(r-1, c) | wall_bit(r+1, c);
+                conflicts[1][index][0] = wall_bit(r, c);
+            }
+        }
+
+        for (int index = 0; index < 81; index++) {
+            nearby[index][0] = nearby[index][1] = 0;
+            for (int d = 0; d < 4; d++) {
+                nearby[index][DIRECTION_WALL_TYPE[d]] |= blockers[index][d];
+                int adjacent = neighbour[index][d];
+                if (adjacent < 0) {continue;}
+                for (int d2 = 0; d2 < 4; d2++) {
+                    nearby[index][DIRECTION_WALL_TYPE[d2]] |= blockers[adjacent][d2];
+                }
+            }
+        }
+    }
+};
+
+const Tables TABLES;
+
+//Zobrist keys for pawns, walls, walls remaining and side to move.
+//Generated from a fixed seed so hashes are stable between runs and builds.
+struct ZobristKeys {
+    uint64_t pawn[2][81];
+    uint64_t wall[2][64];
+    uint64_t walls_remaining[2][11];
+    uint64_t side;
+
+    ZobristKeys() {
+        uint64_t state = 0x51A0C1D0B07ULL;
+        auto next = [&state]() { //splitmix64
+            uint64_t z = (state += 0x9E3779B97F4A7C15ULL);
+            z = (z ^ (z >> 30)) * 0xBF58476D1CE4E5B9ULL;
+            z = (z ^ (z >> 27)) * 0x94D049BB133111EBULL;
+            return z ^ (z >> 31);
+        };
+
+        for (auto& player : pawn) {for (uint64_t& key : player) {key = next();}}
+        for (auto& type : wall) {for (uint64_t& key : type) {key = next();}}
+        for (auto& player : walls_remaining) {for (uint64_t& key : player) {key = next();}}
+        side = next();
+    }
+};
+
+const ZobristKeys ZOBRIST;
+
+inline int step_direction(int from, int to) {
+    int diff = to - from;
+    if (diff == -9) {return UP;}
+    if (diff == 9) {return DOWN;}
+    if (diff == -1) {return LEFT;}
+    return RIGHT;
+}
+
+//81 bit square set used for BFS bookkeeping
+struct SquareSet {
+    uint64_t bits[2] = {0, 0};
+
+    bool contains(int index) const {return (bits[index >> 6] >> (index & 63)) & 1ULL;}
+    void insert(int index) {bits[index >> 6] |= (1ULL << (index & 63));}
+};
+
+//Fixed capacity list of squares so move generation never allocates
+struct SquareList {
+    Square squares[8];
+    int via[8]; //square jumped over to get there, -1 for a plain step
+    int size = 0;
+
+    void push_back(Square square, int over = -1) {via[size] = over; squares[size++] = square;}
+    const Square* begin() const {return squares;}
+    const Square* end() const {return squares + size;}
+};
+
+//Everything needed to take back a move applied with make_move
+struct Undo {
+    Move move;
+    Square previous; //pawn square before a pawn move
+    uint64_t hash; //Zobrist hash before the move
+};
+
+//Shortest path summary for one position.
+//A wall outside cut leaves both paths intact, so it cannot disconnect either player.
+//A wall outside unstable also leaves both distances unchanged.
+struct PathInfo {
+    int distance[2] = {-1, -1};
+    uint64_t cut[2] = {0, 0};      //[type] walls that block a step of either player's path
+    uint64_t blocks[2][2] = {};    //[player][type] walls that block a step of that player's path
+    uint64_t unstable[2] = {0, 0}; //[type] cut plus the walls around either pawn
+
+    bool always_legal(Wall wall) const {
+        return distance[0] >= 0 && distance[1] >= 0 && (cut[wall.type] & wall_bit(wall.row, wall.col)) == 0;
+    }
+
+    bool keeps_distances(Move move) const {
+        return move.type != 2 && (unstable[static_cast<int>(move.type)] & wall_bit(move.row, move.col)) == 0;
     }
 };
 
 class Board {
     public:
         Square pawns[2]; //[player][row/col]
-        std::unordered_set<Wall, WallHash> walls;
+        uint64_t walls[2] = {0, 0}; //[type] bitboard of placed walls
         int walls_remaining[2];
         int current_player;
         bool game_over = false;
+        uint64_t hash = 0; //Zobrist hash, kept up to date by apply_move and unmake_move
 
         Board() {
             //P1
@@ -65,10 +254,35 @@ class Board {
 
             walls_remaining[0] = walls_remaining[1] = 10;
             current_player = 0;
+            hash = compute_hash();
         }
 
-        bool wall_exists(Wall wall) {
-            return (walls.find(wall) != walls.end());
+        //hash the position from scratch. Needed after setting up a board field by field
+        uint64_t compute_hash() const {
+            uint64_t key = 0;
+            for (int player = 0; player < 2; player++) {
+                key ^= ZOBRIST.pawn[player][square_index(pawns[player])];
+                key ^= ZOBRIST.walls_remaining[player][walls_remaining[player]];
+            }
+            for (int type = 0; type < 2; type++) {
+                for (uint64_t bits = walls[type]; bits; bits &= bits - 1) {
+                    key ^= ZOBRIST.wall[type][lowest_bit(bits)];
+                }
+            }
+            if (current_player == 1) {key ^= ZOBRIST.side;}
+            return key;
+        }
+
+        bool wall_exists(Wall wall) const {
+            return (walls[wall.type] & wall_bit(wall.row, wall.col)) != 0;
+        }
+
+        void place_wall(Wall wall) {
+            walls[wall.type] |= wall_bit(wall.row, wall.col);
+        }
+
+        void remove_wall(Wall wall) {
+            walls[wall.type] &= ~wall_bit(wall.row, wall.col);
         }
 
         bool is_valid_location(Square location) const {
@@ -77,128 +291,75 @@ class Board {
             return (row >= 0 && row < 9 && col >= 0 && col < 9);
         }
 
-        bool is_blocked(Square location_a, Square location_b) {
-            int row1 = location_a.row; int col1 = location_a.col;
-            int row2 = location_b.row; int col2 = location_b.col;
+        //is the step from square index in direction d blocked by a wall?
+        bool is_blocked(int index, int d) const {
+            return (walls[DIRECTION_WALL_TYPE[d]] & TABLES.blockers[index][d]) != 0;
+        }
 
-            if (col1 == col2) { //the movement is vertical
-                int lower_row = std::max(row1, row2);
-                if (wall_exists({lower_row, col1, 0}) || wall_exists({lower_row, col1-1, 0})) {return true;}
-            }
+        bool is_blocked(Square location_a, Square location_b) const {
+            int from = square_index(location_a);
+            return is_blocked(from, step_direction(from, square_index(location_b)));
+        }
 
-            if (row1 == row2) { //the movement is horizontal
-                int leftmost_col = std::min(col1, col2);
-                if (wall_exists({row1, leftmost_col, 1}) || wall_exists({row1+1, leftmost_col, 1})) {return true;}
-            }
+        SquareList neighbouring_squares(Square square) const {
+            SquareList neighbours;
+            int index = square_index(square);
+            int pawn_a = square_index(pawns[0]);
+            int pawn_b = square_index(pawns[1]);
 
-            return false;
-        }
+            for (int d = 0; d < 4; d++) {
+                int adjacent = TABLES.neighbour[index][d];
 
-        std::vector<Square> neighbouring_squares(Square square) {
-            int row = square.row;
-            int col = square.col;
-
-            std::vector<Square> neighbours;
-            
-            const int dirs[4][2] = {
-                {-1, 0},
-                {1, 0},
-                {0, -1},
-                {0 , 1}
-            };
-
-            for (const auto& d : dirs) {
-                int dx = d[0];
-                int dy = d[1];
-                int new_row = row + dx;
-                int new_col = col + dy;
-                Square adjacent = {new_row, new_col};
-                
                 //Check if adjacent square is valid and not blocked by wall
-                if (!is_valid_location(adjacent) || is_blocked(square, adjacent)) {
+                if (adjacent < 0 || is_blocked(index, d)) {
                     continue;
                 }
-                
-                //Check if theres a pawn on the adjacent square
-                bool pawn_on_adjacent = (pawns[0] == adjacent || pawns[1] == adjacent);
-                
-                if (!pawn_on_adjacent) {
+
+                if (adjacent != pawn_a && adjacent != pawn_b) {
                     //No pawn - normal move
-                    neighbours.push_back(adjacent);
-                } else {
-                    //Theress a pawn on the adjacent square
-                    int jump_row = new_row + dx;
-                    int jump_col = new_col + dy;
-                    Square jump_square = {jump_row, jump_col};
-                    
-                    //Try to jump over the opponent
-                    if (is_valid_location(jump_square) && !is_blocked(adjacent, jump_square)) {
-                        neighbours.push_back(jump_square);
-                    } else {
-                        //Cant jump - blocked by wall or edge so try diagonal moves
-                        //Diagonal moves are perpendicular to the original direction
-                        
-                        int perp_dirs[2][2] = {
-                            {dy, dx},    //perpendicular direction 1
-                            {-dy, -dx}   //perpendicular direction 2
-                        };
-                        
-                        for (const auto& perp : perp_dirs) {
-                            int perp_dx = perp[0];
-                            int perp_dy = perp[1];
-                            int diag_row = new_row + perp_dx;
-                            int diag_col = new_col + perp_dy;
-                            Square diag_square = {diag_row, diag_col};
-                            
-                            //Check if diagonal square is valid and not blocked from opponents position
-                            if (is_valid_location(diag_square) && !is_blocked(adjacent, diag_square)) {
-                                neighbours.push_back(diag_square);
-                            }
-                        }
+                    neighbours.push_back(index_square(adjacent));
+                    continue;
+                }
+
+                //Theres a pawn on the adjacent square so try to jump over it
+                int jump_square = TABLES.neighbour[adjacent][d];
+                if (jump_square >= 0 && !is_blocked(adjacent, d)) {
+                    neighbours.push_back(index_square(jump_square), adjacent);
+                    continue;
+                }
+
+                //Cant jump - blocked by wall or edge so try the two diagonal moves
+                //Diagonal moves are perpendicular to the original direction
+                const int perp_dirs[4][2] = {{LEFT, RIGHT}, {RIGHT, LEFT}, {UP, DOWN}, {DOWN, UP}};
+                for (int perp : perp_dirs[d]) {
+                    int diag_square = TABLES.neighbour[adjacent][perp];
+                    if (diag_square >= 0 && !is_blocked(adjacent, perp)) {
+                        neighbours.push_back(index_square(diag_square), adjacent);
                     }
                 }
             }
-            
+
             return neighbours;
         }
 
-        bool is_legal_wall(Wall wall) {
-            if (wall_exists(wall)) {return false;}
-
-            int r = wall.row; int c = wall.col; int type = wall.type;
-
-            //Walls cannot hang off the edge of the board
-            if (type == 0) { //Horizontal
-                if (c < 0 || c > 7 || r < 1 || r > 8) {return false;}
-            }
-            else {
-                if (r < 1 || r > 8 || c < 0 || c > 7) {return false;}
-            }
-
-            //Horizontal and vertical walls cannot intersect such that they form a plus shape
-            if (type == 0) {
-                if (wall_exists({r, c, 1})) {return false;}
-            }
-            else {
-                if (wall_exists({r, c, 0})) {return false;}
-            }
+        //Walls cannot hang off the edge of the board, cross another wall or overlap one of the same type
+        bool fits_on_board(Wall wall) const {
+            if (!wall_on_grid(wall.row, wall.col)) {return false;}
+            const uint64_t* conflicts = TABLES.conflicts[wall.type][wall_index(wall.row, wall.col)];
+            return ((walls[0] & conflicts[0]) | (walls[1] & conflicts[1])) == 0;
+        }
 
-            //prevent overlaps of walls of same type
-            if (type == 0) {
-                if (wall_exists({r, c+1, 0}) || wall_exists({r, c-1, 0})) {return false;}
-            }
-            else {
-                if (wall_exists({r+1, c, 1}) || wall_exists({r-1, c, 1})) {return false;}
-            }
+        bool is_legal_wall(Wall wall) {
+            if (!fits_on_board(wall)) {return false;}
 
-            walls.insert(wall);
+            place_wall(wall);
             bool legal = (shortest_path(0) != -1 && shortest_path(1) != -1);
-            walls.erase(wall);
+            remove_wall(wall);
 
             return legal;
         }
 
-        std::vector<Move> legal_pawn_moves() {
+        std::vector<Move> legal_pawn_moves() const {
             std::vector<Move> moves;
             for (Square square : neighbouring_squares(pawns[current_player])) {
                 moves.push_back({square.row, square.col, 2});
@@ -207,16 +368,26 @@ class Board {
         }
 
         std::vector<Move> legal_wall_moves() {
+            return legal_wall_moves(path_info());
+        }
+
+        //info must describe the current position. Only walls that cut one of its paths need a BFS
+        std::vector<Move> legal_wall_moves(const PathInfo& info) {
             std::vector<Move> moves;
             if (walls_remaining[current_player] == 0) {return moves;}
 
-            for (int row = 0; row < 8; row++) {
+            for (int row = 1; row <= 8; row++) { //row 0 would hang off the top of the board
                 for (int col = 0; col < 8; col++) {
                     for (int type = 0; type < 2; type++) {
                         Wall wall = {row, col, type};
-                        if (is_legal_wall(wall)) {
-                            Move move = {row, col, type};
-                            moves.push_back(move);
+                        if (!fits_on_board(wall)) {continue;}
+
+                        if (info.always_legal(wall)) {
+                            COUNT_STAT(board_counters.walls_without_bfs);
+                            moves.push_back({row, col, static_cast<char>(type)});
+                        }
+                        else if (is_legal_wall(wall)) {
+                            moves.push_back({row, col, static_cast<char>(type)});
                         }
                     }
                 }
@@ -225,38 +396,58 @@ class Board {
         }
 
         std::vector<Move> legal_moves() {
+            return legal_moves(path_info());
+        }
+
+        std::vector<Move> legal_moves(const PathInfo& info) {
             std::vector<Move> legal_moves = legal_pawn_moves();
-            std::vector<Move> wall_moves = legal_wall_moves();
+            std::vector<Move> wall_moves = legal_wall_moves(info);
             legal_moves.insert(legal_moves.end(), wall_moves.begin(), wall_moves.end());
 
             return legal_moves;
         }
 
         void apply_move(Move move) {
+            int player = current_player;
             if (move.type == 2) { //pawn
-                pawns[current_player] = {move.row, move.col};    
+                hash ^= ZOBRIST.pawn[player][square_index(pawns[player])];
+                pawns[player] = {move.row, move.col};
+                hash ^= ZOBRIST.pawn[player][square_index(pawns[player])];
             }
             else { //wall
-                walls.insert({move.row, move.col, move.type});
-                walls_remaining[current_player] -= 1;
+                place_wall({move.row, move.col, move.type});
+                hash ^= ZOBRIST.wall[static_cast<int>(move.type)][wall_index(move.row, move.col)];
+                hash ^= ZOBRIST.walls_remaining[player][walls_remaining[player]];
+                walls_remaining[player] -= 1;
+                hash ^= ZOBRIST.walls_remaining[player][walls_remaining[player]];
             }
 
-            current_player = 1 - current_player;
+            current_player = 1 - player;
+            hash ^= ZOBRIST.side;
         }
 
-        Board copy() const {
-            Board new_board;
-            new_board.pawns[0].row = pawns[0].row;
-            new_board.pawns[0].col = pawns[0].col;
-            new_board.pawns[1].row = pawns[1].row;
-            new_board.pawns[1].col = pawns[1].col;
+        //apply a move in place, returning what is needed to take it back with unmake_move
+        Undo make_move(Move move) {
+            Undo undo = {move, pawns[current_player], hash};
+            apply_move(move);
+            return undo;
+        }
 
-            new_board.walls = walls;
-            new_board.walls_remaining[0] = walls_remaining[0];
-            new_board.walls_remaining[1] = walls_remaining[1];
-            new_board.current_player = current_player;
+        void unmake_move(const Undo& undo) {
+            current_player = 1 - current_player;
+            hash = undo.hash;
 
-            return new_board;
+            if (undo.move.type == 2) {
+                pawns[current_player] = undo.previous;
+            }
+            else {
+                remove_wall({undo.move.row, undo.move.col, undo.move.type});
+                walls_remaining[current_player] += 1;
+            }
+        }
+
+        Board copy() const {
+            return *this;
         }
 
         bool is_winner(int player) const {
@@ -268,26 +459,49 @@ class Board {
             }
         }
 
-        int shortest_path(int player) { //get the shortest path distance for that player. -1 if no path.
-            Square start_position = pawns[player];
-            std::queue<std::pair<Square, int>> queue;
-            std::unordered_set<Square, SquareHash> visited;
-
-            std::pair<Square, int> start_node = {start_position, 0};
-            visited.insert(start_position);
-            queue.push(start_node);
+        //get the shortest path distance for that player. -1 if no path.
+        //If cut is given, the walls that would block a step of the path found are added to it ([type] masks)
+        int shortest_path(int player, uint64_t* cut = nullptr) const {
+            COUNT_STAT(board_counters.bfs_calls);
+            int goal_row = (player == 0) ? 0 : 8;
+            int queue[81];
+            int distance[81];
+            int parent[81];
+            int via[81];
+            int head = 0; int tail = 0;
+            SquareSet visited;
 
-            while (!queue.empty()) {
-                std::pair<Square, int> node = queue.front();
-                queue.pop();
+            int start = square_index(pawns[player]);
+            visited.insert(start);
+            queue[tail++] = start;
+            distance[start] = 0;
 
-                if (player == 0 && node.first.row == 0) {return node.second;}
-                if (player == 1 && node.first.row == 8) {return node.second;}
+            while (head < tail) {
+                int node = queue[head++];
+                if (node / 9 == goal_row) {
+                    if (cut != nullptr) {
+                        for (int square = node; square != start; square = parent[square]) {
+                            if (via[square] < 0) {
+                                add_step_blockers(parent[square], square, cut);
+                            }
+                            else { //jump or diagonal uses the steps on to and off the jumped pawn
+                                add_step_blockers(parent[square], via[square], cut);
+                                add_step_blockers(via[square], square, cut);
+                            }
+                        }
+                    }
+                    return distance[node];
+                }
 
-                for (Square neighbour : neighbouring_squares(node.first)) {
-                    if (visited.find(neighbour) == visited.end()) {
-                        visited.insert(neighbour);
-                        queue.push({neighbour, node.second + 1});
+                SquareList neighbours = neighbouring_squares(index_square(node));
+                for (int i = 0; i < neighbours.size; i++) {
+                    int next = square_index(neighbours.squares[i]);
+                    if (!visited.contains(next)) {
+                        visited.insert(next);
+                        distance[next] = distance[node] + 1;
+                        parent[next] = node;
+                        via[next] = neighbours.via[i];
+                        queue[tail++] = next;
                     }
                 }
             }
@@ -295,100 +509,1312 @@ class Board {
             return -1;
 
         }
+
+        //Shortest path for the player ignoring both pawns, as if they could never meet. The squares along it
+        //(starting with the pawn's square) are written to path. -1 if there is no path
+        int free_path(int player, int* path) const {
+            int goal_row = (player == 0) ? 0 : 8;
+            int queue[81];
+            int distance[81];
+            int parent[81];
+            int head = 0; int tail = 0;
+            SquareSet visited;
+
+            int start = square_index(pawns[player]);
+            visited.insert(start);
+            queue[tail++] = start;
+            distance[start] = 0;
+
+            while (head < tail) {
+                int node = queue[head++];
+                if (node / 9 == goal_row) {
+                    for (int square = node; ; square = parent[square]) {
+                        path[distance[square]] = square;
+                        if (square == start) {break;}
+                    }
+                    return distance[node];
+                }
+
+                for (int d = 0; d < 4; d++) {
+                    int next = TABLES.neighbour[node][d];
+                    if (next >= 0 && !is_blocked(node, d) && !visited.contains(next)) {
+                        visited.insert(next);
+                        distance[next] = distance[node] + 1;
+                        parent[next] = node;
+                        queue[tail++] = next;
+                    }
+                }
+            }
+            return -1;
+        }
+
+        //Both players' shortest paths and the walls that could change them
+        PathInfo path_info() const {
+            PathInfo info;
+            for (int player = 0; player < 2; player++) {
+                info.distance[player] = shortest_path(player, info.blocks[player]);
+                info.cut[0] |= info.blocks[player][0];
+                info.cut[1] |= info.blocks[player][1];
+            }
+
+            //A wall next to a pawn can turn a blocked jump into diagonal moves, which may shorten a path
+            info.unstable[0] = info.cut[0];
+            info.unstable[1] = info.cut[1];
+            for (int player = 0; player < 2; player++) {
+                int index = square_index(pawns[player]);
+                for (int d = 0; d < 4; d++) {
+                    info.unstable[DIRECTION_WALL_TYPE[d]] |= TABLES.blockers[index][d];
+                }
+            }
+            return info;
+        }
+
+    private:
+        static void add_step_blockers(int from, int to, uint64_t* cut) {
+            int d = step_direction(from, to);
+            cut[DIRECTION_WALL_TYPE[d]] |= TABLES.blockers[from][d];
+        }
+};
+
+//Exact result of a race that walls can no longer change, from player 1's point of view (100 less 0.01 per move
+//the winner still needs, so quicker wins score higher). Returns false if the result is not certain.
+//The race is judged on distances that ignore the pawns, which are exact as long as the pawns never meet (to jump or
+//block each other). The player ahead keeps the win when the other player has no walls left to lengthen their path
+//and cannot get next to any square of it before the winner has moved on - the loser is at most j squares from
+//where it started after j moves.
+//expected_winner is the player ahead on the usual shortest paths. Its path is checked first as it usually decides
+bool solve_race(const Board& board, int expected_winner, double& score) {
+    int winner = expected_winner;
+    int loser = 1 - winner;
+    if (board.walls_remaining[loser] > 0) {return false;}
+
+    int path[81];
+    int winner_distance = board.free_path(winner, path);
+    if (winner_distance < 0) {return false;}
+
+    //while the winner stands on the k-th square of its path the loser has made at most k+1 moves (k+2 if it moves first)
+    int loser_moves = (winner == board.current_player) ? 1 : 2;
+    Square start = board.pawns[loser];
+    for (int k = 0; k < winner_distance; k++, loser_moves++) {
+        Square square = index_square(path[k]);
+        int gap = std::abs(square.row - start.row) + std::abs(square.col - start.col);
+        if (gap <= loser_moves + 1) {return false;}
+    }
+
+    //the mover wins ties by moving first
+    int loser_distance = board.free_path(loser, path);
+    bool ahead = (winner == board.current_player) ? winner_distance <= loser_distance : winner_distance < loser_distance;
+    if (loser_distance >= 0 && !ahead) {return false;}
+
+    score = (100 - 0.01 * winner_distance) * (winner == 0 ? 1 : -1);
+    return true;
+}
+
+//Exact results of pawn races for positions where neither player has walls left, which solve_race only settles while
+//the pawns cannot meet. The pawn-only game on a set of walls is solved by retrograde analysis of every
+//(pawn 1, pawn 2, side to move) state, so jumps and pawns blocking each other are accounted for. Each search thread
+//has its own, keeping the solved tables of the last few wall sets
+class RaceCache {
+    public:
+        RaceCache() : tables(64) {}
+
+        //score as solve_race gives it. Returns false if neither side can force a win
+        bool solved_race(const Board& board, double& score) {
+            uint64_t key = (board.walls[0] * 0x9E3779B97F4A7C15ULL) ^ board.walls[1];
+            Table& table = tables[(key ^ (key >> 32)) & (tables.size() - 1)];
+            if (!table.valid || table.walls[0] != board.walls[0] || table.walls[1] != board.walls[1]) {solve(board, table);}
+
+            int plies = table.result[state_index(square_index(board.pawns[0]), square_index(board.pawns[1]), board.current_player)];
+            if (plies == 0) {return false;}
+            int winner = (plies > 0) ? board.current_player : 1 - board.current_player;
+            score = (100 - 0.01 * ((std::abs(plies) + 1) / 2)) * (winner == 0 ? 1 : -1); //the winner makes every other move
+            return true;
+        }
+
+    private:
+        static const int STATES = 81 * 81 * 2;
+
+        struct Table {
+            uint64_t walls[2] = {0, 0};
+            bool valid = false;
+            std::vector<int16_t> result; //[state] moves to the end of the game with best play, positive if the side to move wins, 0 if nobody can force a win
+        };
+
+        static int state_index(int pawn0, int pawn1, int side) {return (pawn0 * 81 + pawn1) * 2 + side;}
+
+        //Every state where the mover can step onto its goal row is won in one move. Working back from those, a state
+        //is won as soon as one move leads to a lost state and lost once every move leads to a won one. States are
+        //settled in order of distance, so wins are as quick and losses as slow as possible
+        void solve(const Board& position, Table& table) {
+            table.walls[0] = position.walls[0];
+            table.walls[1] = position.walls[1];
+            table.valid = true;
+            table.result.assign(STATES, 0);
+            remaining.assign(STATES, 0);
+            edge_from.clear();
+            edge_to.clear();
+            queue.clear();
+
+            //a pawn's moves only depend on the other pawn when it is next to it, otherwise they are the plain steps
+            Board board = position; //only its walls and pawns are used
+            SquareList steps[81];
+            for (int square = 0; square < 81; square++) {
+                for (int d = 0; d < 4; d++) {
+                    int next = TABLES.neighbour[square][d];
+                    if (next >= 0 && !board.is_blocked(square, d)) {steps[square].push_back(index_square(next));}
+                }
+            }
+
+            for (int side = 0; side < 2; side++) {
+                int goal_row = (side == 0) ? 0 : 8;
+                for (int pawn = 0; pawn < 81; pawn++) {
+                    if (pawn / 9 == goal_row) {continue;} //the game is over
+                    for (int other = 0; other < 81; other++) {
+                        if (other == pawn || other / 9 == 8 - goal_row) {continue;}
+                        bool adjacent = false;
+                        for (int d = 0; d < 4; d++) {adjacent |= (TABLES.neighbour[pawn][d] == other);}
+                        SquareList jumps;
+                        if (adjacent) {
+                            board.pawns[side] = index_square(pawn);
+                            board.pawns[1 - side] = index_square(other);
+                            jumps = board.neighbouring_squares(board.pawns[side]);
+                        }
+
+                        int state = (side == 0) ? state_index(pawn, other, 0) : state_index(other, pawn, 1);
+                        for (Square square : adjacent ? jumps : steps[pawn]) {
+                            if (square.row == goal_row) {
+                                table.result[state] = 1;
+                                queue.push_back(state);
+                                break;
+                            }
+                            int to = square_index(square);
+                            edge_from.push_back(state);
+                            edge_to.push_back((side == 0) ? state_index(to, other, 1) : state_index(other, to, 0));
+                            remaining[state]++;
+                        }
+                    }
+                }
+            }
+
+            //moves into each state, grouped by state
+            first_predecessor.assign(STATES + 1, 0);
+            for (int to : edge_to) {first_predecessor[to + 1]++;}
+            for (int state = 0; state < STATES; state++) {first_predecessor[state + 1] += first_predecessor[state];}
+            next_slot.assign(first_predecessor.begin(), first_predecessor.end() - 1);
+            predecessors.resize(edge_to.size());
+            for (std::size_t i = 0; i < edge_to.size(); i++) {predecessors[next_slot[edge_to[i]]++] = edge_from[i];}
+
+            for (std::size_t head = 0; head < queue.size(); head++) {
+                int state = queue[head];
+                int plies = table.result[state];
+                for (int i = first_predecessor[state]; i < first_predecessor[state + 1]; i++) {
+                    int previous = predecessors[i];
+                    if (table.result[previous] != 0) {continue;}
+                    if (plies < 0) { //moving here wins
+                        table.result[previous] = static_cast<int16_t>(1 - plies);
+                        queue.push_back(previous);
+                    }
+                    else if (--remaining[previous] == 0) { //every move loses
+                        table.result[previous] = static_cast<int16_t>(-(plies + 1));
+                        queue.push_back(previous);
+                    }
+                }
+            }
+        }
+
+        std::vector<Table> tables;
+
+        //scratch space of solve
+        std::vector<uint8_t> remaining; //[state] moves not yet known to lose
+        std::vector<int> edge_from, edge_to, first_predecessor, next_slot, predecessors, queue;
+};
+
+enum Bound : uint8_t {EXACT = 0, LOWER = 1, UPPER = 2};
+
+struct TTEntry {
+    double score = 0;
+    Move move = {0, 0, 0};
+    int depth = 0;
+    Bound bound = EXACT;
+    uint8_t generation = 0;
+};
+
+//Fixed size transposition table of two entry buckets, shared by every search thread.
+//Slot 0 keeps the deepest result (unless it is from an older search), slot 1 is always replaced.
+//Entries are stored lock free: each slot keeps key ^ score ^ data, so a slot torn by two threads
+//writing at once no longer matches its key and is treated as a miss.
+class TranspositionTable {
+    public:
+        void resize(std::size_t megabytes) {
+            std::size_t buckets = 1;
+            std::size_t target = std::max<std::size_t>(megabytes, 1) * 1024 * 1024 / (2 * sizeof(Slot));
+            while (buckets * 2 <= target) {buckets *= 2;}
+
+            if (buckets * 2 != slot_count) {
+                slots.reset(new Slot[buckets * 2]);
+                slot_count = buckets * 2;
+                mask = buckets - 1;
+            }
+        }
+
+        std::size_t size_megabytes() const {
+            return slot_count * sizeof(Slot) / (1024 * 1024);
+        }
+
+        void clear() {
+            for (std::size_t i = 0; i < slot_count; i++) {slots[i].write(0, 0, 0);}
+        }
+
+        void new_search() {
+            generation++;
+        }
+
+        bool probe(uint64_t key, TTEntry& entry) const {
+            const Slot* bucket = &slots[(key & mask) * 2];
+            for (int slot = 0; slot < 2; slot++) {
+                uint64_t score_bits, data;
+                if (bucket[slot].read(score_bits, data) == key && data != 0) {
+                    std::memcpy(&entry.score, &score_bits, sizeof(double));
+                    entry.move = {static_cast<int>(data & 0xFF), static_cast<int>((data >> 8) & 0xFF), static_cast<char>((data >> 16) & 0xFF)};
+                    entry.depth = static_cast<int>((data >> 24) & 0xFF) - 1;
+                    entry.bound = static_cast<Bound>((data >> 32) & 0xFF);
+                    entry.generation = static_cast<uint8_t>((data >> 40) & 0xFF);
+                    return true;
+                }
+            }
+            return false;
+        }
+
+        void store(uint64_t key, int depth, Bound bound, double score, Move move) {
+            Slot* bucket = &slots[(key & mask) * 2];
+            uint64_t score_bits, data0, data1;
+            uint64_t key0 = bucket[0].read(score_bits, data0);
+            uint64_t key1 = bucket[1].read(score_bits, data1);
+            int depth0 = static_cast<int>((data0 >> 24) & 0xFF) - 1;
+            int depth1 = static_cast<int>((data1 >> 24) & 0xFF) - 1;
+            uint8_t generation0 = static_cast<uint8_t>((data0 >> 40) & 0xFF);
+
+            Slot* slot = &bucket[1];
+            if (key0 == key || depth0 <= depth || generation0 != generation) {
+                slot = &bucket[0];
+            }
+            else if (key1 == key && depth1 > depth) {
+                return; //keep the deeper result for this position
+            }
+
+            //depth is stored +1 so an all zero slot reads as empty
+            uint64_t data = static_cast<uint64_t>(move.row & 0xFF) | (static_cast<uint64_t>(move.col & 0xFF) << 8)
+                          | (static_cast<uint64_t>(move.type & 0xFF) << 16) | (static_cast<uint64_t>(depth + 1) << 24)
+                          | (static_cast<uint64_t>(bound) << 32) | (static_cast<uint64_t>(generation) << 40);
+            std::memcpy(&score_bits, &score, sizeof(double));
+            slot->write(key ^ score_bits ^ data, score_bits, data);
+        }
+
+    private:
+        struct Slot {
+            std::atomic<uint64_t> check{0};
+            std::atomic<uint64_t> score{0};
+            std::atomic<uint64_t> data{0};
+
+            //returns the key the slot was written for
+            uint64_t read(uint64_t& score_bits, uint64_t& data_bits) const {
+                score_bits = score.load(std::memory_order_relaxed);
+                data_bits = data.load(std::memory_order_relaxed);
+                return check.load(std::memory_order_relaxed) ^ score_bits ^ data_bits;
+            }
+
+            void write(uint64_t check_bits, uint64_t score_bits, uint64_t data_bits) {
+                check.store(check_bits, std::memory_order_relaxed);
+                score.store(score_bits, std::memory_order_relaxed);
+                data.store(data_bits, std::memory_order_relaxed);
+            }
+        };
+
+        std::unique_ptr<Slot[]> slots;
+        std::size_t slot_count = 0;
+        uint64_t mask = 0;
+        uint8_t generation = 0;
+};
+
+//Direct mapped cache of PathInfo by position hash. Each search thread has its own.
+//Iterative deepening and transpositions revisit the same positions, so most lookups skip both BFS runs.
+class PathCache {
+    public:
+        PathCache() : entries(1 << 16) {}
+
+        const PathInfo& lookup(const Board& board) {
+            return find(board).info;
+        }
+
+        //solve_race for the position, remembered along with its paths
+        bool solved_race(const Board& board, double& score) {
+            Entry& entry = find(board);
+            if (entry.race == UNTRIED) {
+                int mover = board.current_player;
+                int ahead = (entry.info.distance[mover] <= entry.info.distance[1 - mover]) ? mover : 1 - mover;
+                entry.race = solve_race(board, ahead, entry.race_score) ? SOLVED : UNSOLVED;
+            }
+            score = entry.race_score;
+            return entry.race == SOLVED;
+        }
+
+    private:
+        enum RaceState : uint8_t {UNTRIED, UNSOLVED, SOLVED};
+
+        struct Entry {
+            uint64_t key = 0;
+            bool valid = false;
+            RaceState race = UNTRIED;
+            double race_score = 0;
+            PathInfo info;
+        };
+
+        Entry& find(const Board& board) {
+            Entry& entry = entries[board.hash & (entries.size() - 1)];
+            if (!entry.valid || entry.key != board.hash) {
+                entry.key = board.hash;
+                entry.info = board.path_info();
+                entry.race = UNTRIED;
+                entry.valid = true;
+            }
+            return entry;
+        }
+
+        std::vector<Entry> entries;
 };
 
-double evaluate(Board board) {
-    int distance0 = board.shortest_path(0);
-    int distance1 = board.shortest_path(1);
+//History heuristic: how often each move (by move code, per side) caused a beta cutoff, weighted by depth.
+//Kept between searches and halved at the start of each so old results fade
+class HistoryTable {
+    public:
+        int score(int side, Move move) const {return scores[side][encode_move(move)];}
+
+        void reward(int side, Move move, int depth) {
+            int& entry = scores[side][encode_move(move)];
+            entry += depth * depth;
+            if (entry > (1 << 24)) {age();} //stay well clear of the killer and transposition table move scores
+        }
+
+        void age() {
+            for (auto& side : scores) {for (int& entry : side) {entry /= 2;}}
+        }
 
+        void clear() {
+            for (auto& side : scores) {for (int& entry : side) {entry = 0;}}
+        }
+
+    private:
+        int scores[2][209] = {};
+};
+
+//Search state owned by one search thread and kept between searches
+struct ThreadState {
+    PathCache paths;
+    RaceCache races;
+    HistoryTable history;
+};
+
+//Weights of the evaluation terms
+struct EvalWeights {
+    double path = 1.0;  //per square of shortest path difference
+    double walls = 0.2; //per wall of walls remaining difference
+
+    bool operator==(const EvalWeights& other) const {
+        return (path == other.path && walls == other.walls);
+    }
+};
+
+//Which wall moves the search looks at. Relevant walls cut either player's current shortest path or lie next to a pawn
+enum WallSelection {
+    ALL_WALLS = 0,    //every legal wall in generation order
+    REDUCE_WALLS = 1, //relevant walls first, the rest searched two plies shallower unless they look best
+    PRUNE_WALLS = 2   //relevant walls only
+};
+
+//Options for one search
+struct SearchSettings {
+    int max_depth = 4;
+    int time_ms = 0; //0 searches to max_depth without a clock
+    int threads = 1;
+    EvalWeights weights;
+    WallSelection wall_selection = ALL_WALLS;
+    bool late_move_reductions = false; //search late quiet wall moves two plies shallower first
+};
+
+double evaluate(const Board& board, int distance0, int distance1, const EvalWeights& weights) {
     int walls0 = board.walls_remaining[0];
     int walls1 = board.walls_remaining[1];
 
-    double score = (distance1 - distance0) + (walls0 - walls1)*0.2;
+    double score = (distance1 - distance0)*weights.path + (walls0 - walls1)*weights.walls;
 
     return score;
 }
 
-std::pair<Move, double> minimax(Board board, int depth, double alpha, double beta, bool maximisingPlayer) {
+double evaluate(const Board& board, PathCache& paths, const EvalWeights& weights) {
+    const PathInfo& info = paths.lookup(board);
+    return evaluate(board, info.distance[0], info.distance[1], weights);
+}
+
+//Scores at or beyond this are won (or lost) positions: 100 for a finished game, a little less for a solved race
+const double SOLVED_SCORE = 99;
+
+//What a search did. Counters other than nodes stay zero in BOT_NO_STATS builds
+struct SearchStats {
+    uint64_t nodes = 0;
+    uint64_t leaf_evaluations = 0;
+    uint64_t bfs_calls = 0;
+    uint64_t walls_without_bfs = 0;
+    uint64_t beta_cutoffs = 0;
+    uint64_t tt_hits = 0;
+    uint64_t tt_cutoffs = 0;
+    uint64_t races_solved = 0; //nodes scored exactly by solve_race or a RaceCache
+
+    int completed_depth = 0;
+    int threads = 1;
+    double score = 0;
+    double seconds = 0;
+    std::vector<double> depth_seconds; //time to complete each iteration, from depth 1
+    std::vector<uint64_t> depth_nodes; //nodes searched by the end of each iteration
+    std::vector<Move> principal_variation;
+
+    void add_counters(const SearchStats& other) {
+        nodes += other.nodes;
+        leaf_evaluations += other.leaf_evaluations;
+        bfs_calls += other.bfs_calls;
+        walls_without_bfs += other.walls_without_bfs;
+        beta_cutoffs += other.beta_cutoffs;
+        tt_hits += other.tt_hits;
+        tt_cutoffs += other.tt_cutoffs;
+        races_solved += other.races_solved;
+    }
+};
+
+//State for one thread of a search
+struct SearchContext {
+    TranspositionTable& tt; //shared between threads
+    PathCache& paths; //owned by this thread
+    RaceCache& races; //owned by this thread
+    HistoryTable& history; //owned by this thread
+    const std::atomic<bool>& stop; //set by another thread to end the search early
+    EvalWeights weights;
+    WallSelection wall_selection = ALL_WALLS;
+    bool late_move_reductions = false;
+
+    std::chrono::steady_clock::time_point deadline;
+    bool timed = false;
+    bool abortable = false; //the main thread always completes depth 1 so it has a move to return
+    bool aborted = false;
+    SearchStats stats; //counters of this thread, iteration timings of the main thread
+
+    int completed_depth = 0;
+    std::pair<Move, double> best = {{0, 0, 0}, 0}; //result of the deepest completed iteration
+
+    static const int MAX_PLY = 64;
+    int ply = 0; //distance from the root
+    Move killers[MAX_PLY][2] = {}; //the last two moves that caused a beta cutoff at each ply
+
+    SearchContext(TranspositionTable& tt, ThreadState& thread, const std::atomic<bool>& stop) : tt(tt), paths(thread.paths), races(thread.races), history(thread.history), stop(stop) {}
+
+    //flag the search as aborted once it is stopped or out of time (the clock is read every few hundred nodes)
+    bool out_of_time() {
+        if (!abortable || aborted) {return aborted;}
+        if (stop.load(std::memory_order_relaxed)) {
+            aborted = true;
+        }
+        else if (timed && (stats.nodes & 127) == 0 && std::chrono::steady_clock::now() >= deadline) {
+            aborted = true;
+        }
+        return aborted;
+    }
+};
+
+//Record a search result, classifying the score against the window it was searched with
+void store_result(SearchContext& context, uint64_t key, int depth, double alpha, double beta, double value, Move best_move) {
+    Bound bound = EXACT;
+    if (value <= alpha) {bound = UPPER;}
+    else if (value >= beta) {bound = LOWER;}
+    context.tt.store(key, depth, bound, value, best_move);
+}
+
+std::pair<Move, double> minimax(Board& board, int depth, double alpha, double beta, bool maximisingPlayer, SearchContext& context);
+
+//Search one child of a node at the given depth.
+//Leaf children reached by a wall that leaves both paths untouched are scored from the parent's distances without a BFS.
+std::pair<Move, double> search_child(Board& board, Move move, int depth, double alpha, double beta, bool maximisingPlayer, SearchContext& context, const PathInfo& info) {
+    Undo undo = board.make_move(move);
+    std::pair<Move, double> result;
+    if (depth == 1 && info.keeps_distances(move)) {
+        context.stats.nodes++;
+        COUNT_STAT(context.stats.leaf_evaluations);
+        result = {{0,0,0}, evaluate(board, info.distance[0], info.distance[1], context.weights)};
+    }
+    else {
+        context.ply++;
+        result = minimax(board, depth-1, alpha, beta, maximisingPlayer, context);
+        context.ply--;
+    }
+    board.unmake_move(undo);
+    return result;
+}
+
+//Principal variation search of one move. The first move of a node gets the full window. Later moves are only
+//expected to be worse, so they are searched with a null window that just tests whether they beat the best so far,
+//and searched again with the full window when they do.
+//A reduced move is first searched two plies shallower (two so the reduced search ends on the same side to move - the
+//evaluation swings between odd and even depths) and only searched at full depth if that result would beat the best.
+std::pair<Move, double> search_move(Board& board, Move move, int depth, double alpha, double beta, bool maximisingPlayer, SearchContext& context, const PathInfo& info, bool first, bool reduce) {
+    const double NULL_WINDOW = 1e-6; //far below the smallest score difference the evaluation can produce
+    bool child_maximising = !maximisingPlayer;
+    if (first) {
+        return search_child(board, move, depth, alpha, beta, child_maximising, context, info);
+    }
+
+    double null_alpha = maximisingPlayer ? alpha : beta - NULL_WINDOW;
+    double null_beta = maximisingPlayer ? alpha + NULL_WINDOW : beta;
+    auto improves = [&](double score) {return maximisingPlayer ? score > alpha : score < beta;};
+
+    std::pair<Move, double> result;
+    if (reduce) {
+        result = search_child(board, move, depth - 2, null_alpha, null_beta, child_maximising, context, info);
+        if (context.aborted || !improves(result.second)) {return result;}
+    }
+
+    result = search_child(board, move, depth, null_alpha, null_beta, child_maximising, context, info);
+    if (context.aborted || !improves(result.second)) {return result;}
+
+    bool inside_window = maximisingPlayer ? result.second < beta : result.second > alpha;
+    if (inside_window && beta - alpha > NULL_WINDOW) {
+        result = search_child(board, move, depth, alpha, beta, child_maximising, context, info);
+    }
+    return result;
+}
+
+//[type] masks of the walls a selective search treats as relevant: walls cutting either player's shortest path
+//and walls next to either pawn
+void relevant_walls(const Board& board, const PathInfo& info, uint64_t* relevant) {
+    int pawn0 = square_index(board.pawns[0]);
+    int pawn1 = square_index(board.pawns[1]);
+    for (int type = 0; type < 2; type++) {
+        relevant[type] = info.cut[type] | TABLES.nearby[pawn0][type] | TABLES.nearby[pawn1][type];
+    }
+}
+
+struct ScoredMove {
+    Move move;
+    int score;
+};
+
+std::pair<Move, double> minimax(Board& board, int depth, double alpha, double beta, bool maximisingPlayer, SearchContext& context) {
+    context.stats.nodes++;
+    if (context.out_of_time()) {return {{0,0,0}, 0};}
+
     if (board.is_winner(0)) {return {{0,0,0}, 100};}
     if (board.is_winner(1)) {return {{0,0,0}, -100};}
-    if (depth == 0) {return {{0,0,0}, evaluate(board)};}
+
+    //Once walls cannot change the result the race is decided without searching (except at the root, which needs a move).
+    //solve_race is tried first as it is cheap. With no walls left on either side the race tables settle the rest, but
+    //solving a new wall set costs about as much as a few hundred nodes, so only where there is that much to save.
+    //Only tried above the leaves, where it saves a subtree
+    double race_score;
+    bool no_walls = (board.walls_remaining[0] == 0 && board.walls_remaining[1] == 0);
+    if (depth > 0 && context.ply > 0 && (board.walls_remaining[0] == 0 || board.walls_remaining[1] == 0)
+        && (context.paths.solved_race(board, race_score) || (no_walls && depth >= 3 && context.races.solved_race(board, race_score)))) {
+        COUNT_STAT(context.stats.races_solved);
+        return {{0,0,0}, race_score};
+    }
+
+    if (depth == 0) {
+        COUNT_STAT(context.stats.leaf_evaluations);
+        return {{0,0,0}, evaluate(board, context.paths, context.weights)};
+    }
+
+    double alpha_original = alpha;
+    double beta_original = beta;
+
+    TTEntry entry;
+    bool tt_hit = context.tt.probe(board.hash, entry);
+    if (tt_hit) {COUNT_STAT(context.stats.tt_hits);}
+    if (tt_hit && entry.depth >= depth) {
+        if (entry.bound == EXACT) {COUNT_STAT(context.stats.tt_cutoffs); return {entry.move, entry.score};}
+        if (entry.bound == LOWER) {alpha = std::max(alpha, entry.score);}
+        if (entry.bound == UPPER) {beta = std::min(beta, entry.score);}
+        if (alpha >= beta) {COUNT_STAT(context.stats.tt_cutoffs); return {entry.move, entry.score};}
+    }
 
     double value;
     Move best_move;
 
-    std::vector<Move> legal_moves = board.legal_moves();
+    PathInfo info = context.paths.lookup(board); //copied, deeper nodes may evict it
+    std::vector<Move> legal_moves = board.legal_moves(info);
 
-    if (maximisingPlayer) {
-        value = -999.0;
+    //Selective search: relevant walls ahead of the others, which are dropped or searched shallower
+    uint64_t relevant[2] = {~0ULL, ~0ULL};
+    if (context.wall_selection != ALL_WALLS) {relevant_walls(board, info, relevant);}
+    auto is_relevant = [&relevant](Move move) {
+        return move.type == 2 || (relevant[static_cast<int>(move.type)] & wall_bit(move.row, move.col)) != 0;
+    };
+    if (context.wall_selection == PRUNE_WALLS) {
+        legal_moves.erase(std::remove_if(legal_moves.begin(), legal_moves.end(), [&](Move move) {return !is_relevant(move);}), legal_moves.end());
+    }
 
-        for (Move move : legal_moves) {
-            Board new_board = board.copy();
-            new_board.apply_move(move);
-            std::pair<Move, double> result = minimax(new_board, depth-1, alpha, beta, false);
-            
-            if (result.second > value) {
-                value = result.second;
-                best_move = move;
-            }
-            alpha = std::max(alpha, value);
-            if (alpha >= beta) {
-                break;
+    //Move ordering: the best move from an earlier visit, then the killer moves of this ply, then by history score
+    const int TT_MOVE = 1 << 30, KILLER = 1 << 28, RELEVANT = 1 << 26, PATH_WALL = 1 << 25;
+    int side = board.current_player;
+    int ply = std::min(context.ply, SearchContext::MAX_PLY - 1);
+    std::vector<ScoredMove> moves;
+    moves.reserve(legal_moves.size());
+    for (Move move : legal_moves) {
+        int score = context.history.score(side, move);
+        if (tt_hit && move == entry.move) {score += TT_MOVE;}
+        else if (move == context.killers[ply][0]) {score += 2 * KILLER;}
+        else if (move == context.killers[ply][1]) {score += KILLER;}
+        if (is_relevant(move)) {score += RELEVANT;}
+        if (move.type != 2 && (info.blocks[1 - side][static_cast<int>(move.type)] & wall_bit(move.row, move.col))) {score += PATH_WALL;} //cuts the opponent's path
+        moves.push_back({move, score});
+    }
+    std::stable_sort(moves.begin(), moves.end(), [](const ScoredMove& a, const ScoredMove& b) {return a.score > b.score;});
+
+    //Late move reductions: walls after the first few, other than the killers, are searched shallower first.
+    //A selective search also reduces the walls that are not relevant
+    const int FULL_DEPTH_MOVES = 4;
+    bool reducing = depth >= 4 && (context.late_move_reductions || context.wall_selection == REDUCE_WALLS);
+
+    value = maximisingPlayer ? -999.0 : 999.0;
+    for (std::size_t i = 0; i < moves.size(); i++) {
+        Move move = moves[i].move;
+        bool reduce = reducing && move.type != 2 && moves[i].score < KILLER
+                      && ((context.late_move_reductions && i >= FULL_DEPTH_MOVES) || !is_relevant(move));
+        std::pair<Move, double> result = search_move(board, move, depth, alpha, beta, maximisingPlayer, context, info, i == 0, reduce);
+        if (context.aborted) {return {best_move, value};} //result is meaningless, the caller discards it
+
+        if (maximisingPlayer ? result.second > value : result.second < value) {
+            value = result.second;
+            best_move = move;
+        }
+        if (maximisingPlayer) {alpha = std::max(alpha, value);}
+        else {beta = std::min(beta, value);}
+
+        if (alpha >= beta) {
+            COUNT_STAT(context.stats.beta_cutoffs);
+            context.history.reward(side, move, depth);
+            if (!(move == context.killers[ply][0])) {
+                context.killers[ply][1] = context.killers[ply][0];
+                context.killers[ply][0] = move;
             }
+            break;
         }
-        return {best_move, value};
     }
+    store_result(context, board.hash, depth, alpha_original, beta_original, value, best_move);
+    return {best_move, value};
+}
 
-    else { //minimising player
-        value = 999.0;
+//Iterative deepening: search depth first_depth, +1, +2... and keep the result of the deepest completed iteration
+//in context.best. Each iteration starts with an aspiration window around the previous score and the transposition
+//table supplies the previous principal variation first at every node.
+//With a time budget the search stops once it is spent, otherwise it runs to max_depth.
+void iterative_deepening(Board& board, const SearchSettings& settings, SearchContext& context, int first_depth = 1) {
+    const double ASPIRATION_WINDOW = 1.0;
+    bool maximising = (board.current_player == 0);
+    auto start = std::chrono::steady_clock::now();
+    BoardCounters counters_before = board_counters;
 
-        for (Move move : legal_moves) {
-            Board new_board = board.copy();
-            new_board.apply_move(move);
-            std::pair<Move, double> result = minimax(new_board, depth-1, alpha, beta, true);
-            
-            if (result.second < value) {
-                value = result.second;
-                best_move = move;
-            }
-            beta = std::min(beta, value);
-            if (alpha >= beta) {
-                break;
-            }
+    for (int depth = first_depth; depth <= settings.max_depth; depth++) {
+        auto iteration_start = std::chrono::steady_clock::now();
+        double window = ASPIRATION_WINDOW;
+        bool first = (context.completed_depth == 0);
+        double alpha = first ? -999 : context.best.second - window;
+        double beta = first ? 999 : context.best.second + window;
+        std::pair<Move, double> result;
+
+        while (true) {
+            result = minimax(board, depth, alpha, beta, maximising, context);
+            if (context.aborted) {break;}
+
+            //widen the side of the window that failed and search again
+            window *= 4;
+            if (result.second <= alpha && alpha > -999) {alpha = (window > 100) ? -999 : result.second - window;}
+            else if (result.second >= beta && beta < 999) {beta = (window > 100) ? 999 : result.second + window;}
+            else {break;}
+        }
+
+        if (context.aborted) {break;}
+        context.best = result;
+        context.completed_depth = depth;
+        context.abortable = true; //there is a move to fall back on now
+        context.stats.depth_seconds.push_back(std::chrono::duration<double>(std::chrono::steady_clock::now() - iteration_start).count());
+        context.stats.depth_nodes.push_back(context.stats.nodes);
+
+        if (settings.time_ms > 0) {
+            //the next iteration takes several times longer so dont start it past half the budget
+            auto elapsed = std::chrono::steady_clock::now() - start;
+            if (elapsed * 2 >= std::chrono::milliseconds(settings.time_ms)) {break;}
         }
-        return {best_move, value};
+        if (std::abs(context.best.second) >= SOLVED_SCORE) {break;} //forced win or loss found
     }
+
+    context.stats.bfs_calls = board_counters.bfs_calls - counters_before.bfs_calls;
+    context.stats.walls_without_bfs = board_counters.walls_without_bfs - counters_before.walls_without_bfs;
 }
 
-// Main bot function
-py::object bot_main(std::vector<std::pair<int, int>> pawns, std::vector<std::tuple<int, int, int>> walls, std::vector<int> walls_remaining, int current_player, int max_depth) {
+//Follow the stored best moves from the root to recover the principal variation (at most length moves)
+std::vector<Move> principal_variation(Board board, const TranspositionTable& tt, Move first_move, int length) {
+    std::vector<Move> pv = {first_move};
+    board.apply_move(first_move);
+
+    TTEntry entry;
+    while (static_cast<int>(pv.size()) < length && !board.is_winner(0) && !board.is_winner(1) && tt.probe(board.hash, entry)) {
+        std::vector<Move> legal_moves = board.legal_moves();
+        if (std::find(legal_moves.begin(), legal_moves.end(), entry.move) == legal_moves.end()) {break;}
+        pv.push_back(entry.move);
+        board.apply_move(entry.move);
+    }
+    return pv;
+}
+
+//Lazy SMP: every thread runs its own iterative deepening on a copy of the board, sharing one transposition
+//table, so each thread's results feed the move ordering and cutoffs of the others. Odd helpers start one ply
+//deeper to spread the threads over different iterations. Helpers are stopped once the main thread finishes
+//and the deepest completed iteration of any thread is returned.
+//stop ends the search early (from another thread) with the best result completed so far.
+//If stats is given it receives the counters of all threads, the iteration timings of the main thread and the PV.
+std::pair<Move, double> parallel_search(const Board& board, const SearchSettings& settings, TranspositionTable& tt,
+                                        std::vector<std::unique_ptr<ThreadState>>& thread_states, const std::atomic<bool>& stop,
+                                        SearchStats* stats = nullptr) {
+    auto start = std::chrono::steady_clock::now();
+    int threads = std::max(settings.threads, 1);
+    while (static_cast<int>(thread_states.size()) < threads) {thread_states.push_back(std::make_unique<ThreadState>());}
+
+    tt.new_search();
+    std::atomic<bool> helpers_stop{false};
+    auto deadline = start + std::chrono::milliseconds(settings.time_ms);
+
+    std::vector<SearchContext> contexts;
+    contexts.reserve(threads);
+    for (int i = 0; i < threads; i++) {
+        thread_states[i]->history.age();
+        contexts.emplace_back(tt, *thread_states[i], (i == 0) ? stop : helpers_stop);
+        contexts[i].deadline = deadline;
+        contexts[i].timed = (settings.time_ms > 0);
+        contexts[i].weights = settings.weights;
+        contexts[i].wall_selection = settings.wall_selection;
+        contexts[i].late_move_reductions = settings.late_move_reductions;
+        contexts[i].abortable = (i > 0);
+    }
+
+    std::vector<std::thread> helpers;
+    for (int i = 1; i < threads; i++) {
+        helpers.emplace_back([&board, &settings, &contexts, i]() {
+            Board helper_board = board;
+            iterative_deepening(helper_board, settings, contexts[i], 1 + (i % 2));
+        });
+    }
+
+    Board main_board = board;
+    iterative_deepening(main_board, settings, contexts[0]);
+
+    helpers_stop = true;
+    for (std::thread& helper : helpers) {helper.join();}
+
+    const SearchContext* deepest = &contexts[0];
+    for (const SearchContext& context : contexts) {
+        if (context.completed_depth > deepest->completed_depth) {deepest = &context;}
+    }
+
+    if (stats != nullptr) {
+        *stats = contexts[0].stats;
+        for (int i = 1; i < threads; i++) {stats->add_counters(contexts[i].stats);}
+        stats->threads = threads;
+        stats->completed_depth = deepest->completed_depth;
+        stats->score = deepest->best.second;
+        stats->principal_variation = principal_variation(board, tt, deepest->best.first, deepest->completed_depth);
+        stats->seconds = std::chrono::duration<double>(std::chrono::steady_clock::now() - start).count();
+    }
+    return deepest->best;
+}
+
+//A game position plus the search state kept for it between moves: the transposition table, path caches and history tables
+//persist, so each search starts from what the previous ones learned instead of from scratch.
+//The position is updated move by move with push/pop. One search runs at a time and push/pop wait for it.
+class Engine {
+    public:
+        explicit Engine(int tt_mb = 16) {tt.resize(tt_mb);}
+
+        void resize(int tt_mb) {
+            std::lock_guard<std::mutex> lock(mutex);
+            tt.resize(tt_mb);
+        }
+
+        //Changing the position drops a stop request meant for a search of the old one. A stop sent after the position
+        //is set, even before the search has started, ends the next search
+        void set_position(const Board& position) {
+            std::lock_guard<std::mutex> lock(mutex);
+            board = position;
+            history.clear();
+            stop_requested = false;
+        }
+
+        //apply a legal move. Throws std::invalid_argument for an illegal move or once the game is over
+        void push(Move move) {
+            std::lock_guard<std::mutex> lock(mutex);
+            if (board.is_winner(0) || board.is_winner(1)) {throw std::invalid_argument("The game is over");}
+            std::vector<Move> legal_moves = board.legal_moves();
+            if (std::find(legal_moves.begin(), legal_moves.end(), move) == legal_moves.end()) {
+                throw std::invalid_argument("Illegal move code: " + std::to_string(encode_move(move)));
+            }
+            history.push_back(board.make_move(move));
+            stop_requested = false;
+        }
+
+        //take back the last pushed move. Throws std::out_of_range if there is none
+        void pop() {
+            std::lock_guard<std::mutex> lock(mutex);
+            if (history.empty()) {throw std::out_of_range("No move to pop");}
+            board.unmake_move(history.back());
+            history.pop_back();
+            stop_requested = false;
+        }
+
+        std::pair<Move, double> search(const SearchSettings& settings, SearchStats* stats = nullptr) {
+            std::lock_guard<std::mutex> lock(mutex);
+            return run_search(board, settings, stats);
+        }
+
+        //search a position given from scratch, which becomes the engine's position
+        std::pair<Move, double> search(const Board& position, const SearchSettings& settings, SearchStats* stats = nullptr) {
+            std::lock_guard<std::mutex> lock(mutex);
+            board = position;
+            history.clear();
+            return run_search(board, settings, stats);
+        }
+
+        //end a running search (from another thread) with the best move found so far, or the next one if it has not
+        //started yet
+        void stop() {
+            stop_requested = true;
+        }
+
+        //forget every stored search result and the move ordering learnt from them, so the next search runs as on
+        //a new engine (killer moves only last for one search)
+        void clear() {
+            std::lock_guard<std::mutex> lock(mutex);
+            tt.clear();
+            for (auto& thread : thread_states) {thread->history.clear();}
+        }
+
+        const Board& position() const {return board;}
+        std::size_t ply() const {return history.size();}
+
+    private:
+        std::pair<Move, double> run_search(const Board& position, const SearchSettings& settings, SearchStats* stats) {
+            if (!(settings.weights == table_weights)) { //stored scores are meaningless under other weights
+                tt.clear();
+                table_weights = settings.weights;
+            }
+            std::pair<Move, double> result = parallel_search(position, settings, tt, thread_states, stop_requested, stats);
+            stop_requested = false; //used up by this search
+            return result;
+        }
+
+        Board board;
+        std::vector<Undo> history;
+        TranspositionTable tt;
+        std::vector<std::unique_ptr<ThreadState>> thread_states;
+        std::mutex mutex;
+        std::atomic<bool> stop_requested{false};
+        EvalWeights table_weights; //weights the transposition table scores were searched with
+};
+
+//Search state kept between bot_main calls
+Engine default_engine(16);
+
+//Build a board from the state exported by board.Board.export_state_for_bot. Throws py::value_error for a state
+//that is not on the board, the same checks as evaluate_batch
+Board make_board(const std::vector<std::pair<int, int>>& pawns, const std::vector<std::tuple<int, int, int>>& walls, const std::vector<int>& walls_remaining, int current_player) {
+    if (pawns.size() != 2 || walls_remaining.size() != 2) {
+        throw py::value_error("Expected two pawns and two walls_remaining");
+    }
     Board board;
-    board.pawns[0] = {pawns[0].first, pawns[0].second};
-    board.pawns[1] = {pawns[1].first, pawns[1].second};
+    for (int player = 0; player < 2; player++) {
+        board.pawns[player] = {pawns[player].first, pawns[player].second};
+        board.walls_remaining[player] = walls_remaining[player];
+        if (!board.is_valid_location(board.pawns[player]) || board.walls_remaining[player] < 0 || board.walls_remaining[player] > 10) {
+            throw py::value_error("Invalid pawn or walls_remaining for player " + std::to_string(player));
+        }
+    }
     for (std::tuple<int, int, int> wall : walls) {
-        board.walls.insert({std::get<0>(wall), std::get<1>(wall), std::get<2>(wall)});
+        int row = std::get<0>(wall), col = std::get<1>(wall), type = std::get<2>(wall);
+        if (!wall_on_grid(row, col) || (type != 0 && type != 1)) {
+            throw py::value_error("Invalid wall: (" + std::to_string(row) + ", " + std::to_string(col) + ", " + std::to_string(type) + ")");
+        }
+        board.place_wall({row, col, type});
     }
-    board.walls_remaining[0] = walls_remaining[0];
-    board.walls_remaining[1] = walls_remaining[1];
     board.current_player = current_player;
+    if (current_player != 0 && current_player != 1) {
+        throw py::value_error("Invalid current_player: " + std::to_string(current_player));
+    }
+    board.hash = board.compute_hash();
+    return board;
+}
+
+py::object move_to_python(Move move) {
+    if (move.type == 0) {
+        return py::make_tuple(move.row, move.col, "H");
+    }
+    else if (move.type == 1) {
+        return py::make_tuple(move.row, move.col, "V");
+    }
+    else {
+        return py::make_tuple(move.row, move.col);
+    }
+}
 
-    bool maximising = (current_player == 0);
+WallSelection to_wall_selection(int mode) {
+    if (mode < ALL_WALLS || mode > PRUNE_WALLS) {throw std::invalid_argument("wall_selection must be 0 (all), 1 (reduce) or 2 (prune)");}
+    return static_cast<WallSelection>(mode);
+}
 
-    std::pair<Move, double> result = minimax(board, max_depth, -999, 999, maximising);
-    Move best_move = result.first;
+// Main bot function
+py::object bot_main(std::vector<std::pair<int, int>> pawns, std::vector<std::tuple<int, int, int>> walls, std::vector<int> walls_remaining, int current_player, int max_depth, int tt_mb, int time_ms, int threads, double path_weight, double wall_weight, int wall_selection, bool late_move_reductions, bool return_stats) {
+    Board board = make_board(pawns, walls, walls_remaining, current_player);
 
-    std::string move_type;
-    if (best_move.type == 0) {
-        return py::make_tuple(best_move.row, best_move.col, "H");
+    SearchSettings settings;
+    settings.max_depth = max_depth;
+    settings.time_ms = time_ms;
+    settings.threads = threads;
+    settings.weights.path = path_weight;
+    settings.weights.walls = wall_weight;
+    settings.wall_selection = to_wall_selection(wall_selection);
+    settings.late_move_reductions = late_move_reductions;
+
+    std::pair<Move, double> result;
+    SearchStats stats;
+    {
+        //the search never touches Python objects so other Python threads can run meanwhile
+        py::gil_scoped_release release;
+        default_engine.resize(tt_mb);
+        result = default_engine.search(board, settings, &stats);
     }
-    else if (best_move.type == 1) {
-        return py::make_tuple(best_move.row, best_move.col, "V");
+    if (return_stats) {
+        return py::make_tuple(move_to_python(result.first), stats);
     }
-    else {
-        return py::make_tuple(best_move.row, best_move.col);
+    return move_to_python(result.first);
+}
+
+//Zobrist hash of a position, e.g. to key an opening book. Stable between runs and builds
+uint64_t position_hash(std::vector<std::pair<int, int>> pawns, std::vector<std::tuple<int, int, int>> walls, std::vector<int> walls_remaining, int current_player) {
+    return make_board(pawns, walls, walls_remaining, current_player).hash;
+}
+
+//Number of leaf positions depth plies ahead. A won position is a leaf, as in board.Board where the game ends.
+uint64_t perft(Board& board, int depth) {
+    if (depth == 0 || board.is_winner(0) || board.is_winner(1)) {return 1;}
+
+    uint64_t nodes = 0;
+    for (Move move : board.legal_moves()) {
+        Undo undo = board.make_move(move);
+        nodes += perft(board, depth - 1);
+        board.unmake_move(undo);
+    }
+    return nodes;
+}
+
+uint64_t perft_main(std::vector<std::pair<int, int>> pawns, std::vector<std::tuple<int, int, int>> walls, std::vector<int> walls_remaining, int current_player, int depth) {
+    Board board = make_board(pawns, walls, walls_remaining, current_player);
+    py::gil_scoped_release release;
+    return perft(board, depth);
+}
+
+//Time the move generation primitives on one position. Returns seconds per call of each
+py::dict benchmark_movegen(std::vector<std::pair<int, int>> pawns, std::vector<std::tuple<int, int, int>> walls, std::vector<int> walls_remaining, int current_player, int iterations) {
+    Board board = make_board(pawns, walls, walls_remaining, current_player);
+    iterations = std::max(iterations, 1);
+    uint64_t sink = 0; //consumed below so the compiler cant drop the work
+    double seconds[4];
+
+    {
+        py::gil_scoped_release release;
+        auto time_calls = [&](auto&& call) {
+            auto start = std::chrono::steady_clock::now();
+            for (int i = 0; i < iterations; i++) {sink += call();}
+            return std::chrono::duration<double>(std::chrono::steady_clock::now() - start).count() / iterations;
+        };
+
+        seconds[0] = time_calls([&]() {return board.legal_moves().size();});
+        seconds[1] = time_calls([&]() {return board.legal_wall_moves().size();});
+        seconds[2] = time_calls([&]() {return static_cast<std::size_t>(board.neighbouring_squares(board.pawns[board.current_player]).size);});
+        seconds[3] = time_calls([&]() {return static_cast<std::size_t>(board.shortest_path(0) + board.shortest_path(1));});
+    }
+
+    py::dict result;
+    result["legal_moves"] = seconds[0];
+    result["legal_wall_moves"] = seconds[1];
+    result["neighbouring_squares"] = seconds[2];
+    result["shortest_path"] = seconds[3] / 2;
+    result["checksum"] = sink;
+    return result;
+}
+
+//Fixed depth single search from an empty transposition table and path cache. Returns (move, SearchStats)
+py::tuple benchmark_search(std::vector<std::pair<int, int>> pawns, std::vector<std::tuple<int, int, int>> walls, std::vector<int> walls_remaining, int current_player, int depth, int threads) {
+    Board board = make_board(pawns, walls, walls_remaining, current_player);
+    SearchSettings settings;
+    settings.max_depth = depth;
+    settings.threads = threads;
+
+    TranspositionTable tt;
+    tt.resize(16);
+    std::vector<std::unique_ptr<ThreadState>> thread_states; //allocated up front so only the search is timed
+    for (int i = 0; i < std::max(threads, 1); i++) {thread_states.push_back(std::make_unique<ThreadState>());}
+    std::atomic<bool> stop{false};
+    std::pair<Move, double> result;
+    SearchStats stats;
+
+    {
+        py::gil_scoped_release release;
+        result = parallel_search(board, settings, tt, thread_states, stop, &stats);
+    }
+    return py::make_tuple(move_to_python(result.first), stats);
+}
+
+using IntArray = py::array_t<int, py::array::c_style | py::array::forcecast>;
+using BitmapArray = py::array_t<uint64_t, py::array::c_style | py::array::forcecast>;
+
+//Evaluate many positions in one call, e.g. to label training data. Positions are given as NumPy arrays:
+//  pawns (N, 2, 2) row and col of each player, walls (N, 2) [H, V] bitmaps with wall (r, c) at bit (r-1)*8 + c,
+//  walls_remaining (N, 2) and current_player (N,) - see board.export_batch
+//Returns a dict of arrays: "distance" (N, 2) shortest path lengths (-1 if there is no path) and "score" (N,) from
+//player 1's point of view. At depth 0 the score is the static evaluation, otherwise it comes from a fixed depth search
+//whose best move is in "move" (N,) as a board.encode_move code (-1 if the game is already won).
+//The positions are split into one block per thread and each thread has its own transposition table, so the
+//results do not depend on timing. threads 0 uses every core.
+py::dict evaluate_batch(IntArray pawns, BitmapArray walls, IntArray walls_remaining, IntArray current_player,
+                        int depth, int threads, int tt_mb, double path_weight, double wall_weight) {
+    py::ssize_t count = current_player.ndim() == 1 ? current_player.shape(0) : -1;
+    if (count < 0 || pawns.ndim() != 3 || pawns.shape(0) != count || pawns.shape(1) != 2 || pawns.shape(2) != 2
+        || walls.ndim() != 2 || walls.shape(0) != count || walls.shape(1) != 2
+        || walls_remaining.ndim() != 2 || walls_remaining.shape(0) != count || walls_remaining.shape(1) != 2) {
+        throw py::value_error("evaluate_batch expects pawns (N, 2, 2), walls (N, 2), walls_remaining (N, 2) and current_player (N,)");
+    }
+
+    auto pawn_data = pawns.unchecked<3>();
+    auto wall_data = walls.unchecked<2>();
+    auto remaining_data = walls_remaining.unchecked<2>();
+    auto player_data = current_player.unchecked<1>();
+
+    std::vector<Board> boards(count);
+    for (py::ssize_t i = 0; i < count; i++) {
+        Board& board = boards[i];
+        for (int player = 0; player < 2; player++) {
+            board.pawns[player] = {pawn_data(i, player, 0), pawn_data(i, player, 1)};
+            board.walls_remaining[player] = remaining_data(i, player);
+            if (!board.is_valid_location(board.pawns[player]) || board.walls_remaining[player] < 0 || board.walls_remaining[player] > 10) {
+                throw py::value_error("evaluate_batch: invalid pawn or walls_remaining in position " + std::to_string(i));
+            }
+        }
+        board.walls[0] = wall_data(i, 0);
+        board.walls[1] = wall_data(i, 1);
+        board.current_player = player_data(i);
+        if (board.current_player != 0 && board.current_player != 1) {
+            throw py::value_error("evaluate_batch: invalid current_player in position " + std::to_string(i));
+        }
+        board.hash = board.compute_hash();
+    }
+
+    py::array_t<double> scores(count);
+    py::array_t<int> distances({count, static_cast<py::ssize_t>(2)});
+    py::array_t<int> moves(count);
+    double* score_out = scores.mutable_data();
+    int* distance_out = distances.mutable_data();
+    int* move_out = moves.mutable_data();
+
+    SearchSettings settings;
+    settings.max_depth = depth;
+    settings.weights.path = path_weight;
+    settings.weights.walls = wall_weight;
+
+    auto evaluate_block = [&](py::ssize_t begin, py::ssize_t end) {
+        TranspositionTable tt;
+        std::vector<std::unique_ptr<ThreadState>> thread_states;
+        std::atomic<bool> stop{false};
+        if (depth > 0) {tt.resize(tt_mb);}
+
+        for (py::ssize_t i = begin; i < end; i++) {
+            const Board& board = boards[i];
+            int distance0 = board.shortest_path(0);
+            int distance1 = board.shortest_path(1);
+            distance_out[2 * i] = distance0;
+            distance_out[2 * i + 1] = distance1;
+            move_out[i] = -1;
+
+            if (board.is_winner(0) || board.is_winner(1)) {
+                score_out[i] = board.is_winner(0) ? 100 : -100;
+            }
+            else if (depth <= 0) {
+                score_out[i] = evaluate(board, distance0, distance1, settings.weights);
+            }
+            else {
+                std::pair<Move, double> result = parallel_search(board, settings, tt, thread_states, stop);
+                score_out[i] = result.second;
+                move_out[i] = encode_move(result.first);
+            }
+        }
+    };
+
+    {
+        py::gil_scoped_release release;
+        if (threads <= 0) {threads = std::max(1u, std::thread::hardware_concurrency());}
+        threads = static_cast<int>(std::max<py::ssize_t>(1, std::min<py::ssize_t>(threads, count)));
+
+        std::vector<std::thread> workers;
+        for (int t = 1; t < threads; t++) {
+            workers.emplace_back(evaluate_block, count * t / threads, count * (t + 1) / threads);
+        }
+        evaluate_block(0, count / threads);
+        for (std::thread& worker : workers) {worker.join();}
+    }
+
+    py::dict result;
+    result["score"] = scores;
+    result["distance"] = distances;
+    if (depth > 0) {result["move"] = moves;}
+    return result;
+}
+
+//Forget every stored search result and the history tables, e.g. so one engine configuration cant reuse another's search
+void clear_tt() {
+    py::gil_scoped_release release;
+    default_engine.clear();
+}
+
+//Ask a running bot_main (on another thread) to return the best move found so far
+void stop_search() {
+    default_engine.stop();
+}
+
+//Engine.search: the best move as a move code, or (move code, SearchStats)
+py::object engine_search(Engine& engine, int max_depth, int time_ms, int threads, double path_weight, double wall_weight, int wall_selection, bool late_move_reductions, bool return_stats) {
+    SearchSettings settings;
+    settings.max_depth = max_depth;
+    settings.time_ms = time_ms;
+    settings.threads = threads;
+    settings.weights.path = path_weight;
+    settings.weights.walls = wall_weight;
+    settings.wall_selection = to_wall_selection(wall_selection);
+    settings.late_move_reductions = late_move_reductions;
+
+    std::pair<Move, double> result;
+    SearchStats stats;
+    {
+        py::gil_scoped_release release;
+        result = engine.search(settings, &stats);
+    }
+    if (return_stats) {
+        return py::make_tuple(encode_move(result.first), stats);
     }
+    return py::int_(encode_move(result.first));
 }
 
 PYBIND11_MODULE(bot_cpp, m) {
-    m.def("bot_main", &bot_main);
-}
\ No newline at end of file
+    py::class_<SearchStats>(m, "SearchStats")
+        .def_readonly("nodes", &SearchStats::nodes)
+        .def_readonly("leaf_evaluations", &SearchStats::leaf_evaluations)
+        .def_readonly("bfs_calls", &SearchStats::bfs_calls)
+        .def_readonly("walls_without_bfs", &SearchStats::walls_without_bfs)
+        .def_readonly("beta_cutoffs", &SearchStats::beta_cutoffs)
+        .def_readonly("tt_hits", &SearchStats::tt_hits)
+        .def_readonly("tt_cutoffs", &SearchStats::tt_cutoffs)
+        .def_readonly("races_solved", &SearchStats::races_solved)
+        .def_readonly("completed_depth", &SearchStats::completed_depth)
+        .def_readonly("threads", &SearchStats::threads)
+        .def_readonly("score", &SearchStats::score)
+        .def_readonly("seconds", &SearchStats::seconds)
+        .def_readonly("depth_seconds", &SearchStats::depth_seconds)
+        .def_readonly("depth_nodes", &SearchStats::depth_nodes)
+        .def_property_readonly("principal_variation", [](const SearchStats& stats) {
+            py::list pv;
+            for (Move move : stats.principal_variation) {pv.append(move_to_python(move));}
+            return pv;
+        })
+        .def_property_readonly("nodes_per_second", [](const SearchStats& stats) {
+            return stats.seconds > 0 ? stats.nodes / stats.seconds : 0.0;
+        })
+        .def_property_readonly_static("counters_enabled", [](py::object) {
+#ifdef BOT_NO_STATS
+            return false;
+#else
+            return true;
+#endif
+        })
+        .def("__repr__", [](const SearchStats& stats) {
+            return "<SearchStats depth=" + std::to_string(stats.completed_depth) + " nodes=" + std::to_string(stats.nodes)
+                 + " score=" + std::to_string(stats.score) + " seconds=" + std::to_string(stats.seconds) + ">";
+        });
+
+    //Persistent engine for a game in progress. Moves are board.encode_move codes
+    py::class_<Engine>(m, "Engine")
+        .def(py::init<int>(), py::arg("tt_mb") = 16)
+        .def("set_position", [](Engine& engine, std::vector<std::pair<int, int>> pawns, std::vector<std::tuple<int, int, int>> walls, std::vector<int> walls_remaining, int current_player) {
+            Board board = make_board(pawns, walls, walls_remaining, current_player);
+            py::gil_scoped_release release;
+            engine.set_position(board);
+        }, py::arg("pawns"), py::arg("walls"), py::arg("walls_remaining"), py::arg("current_player"))
+        .def("reset", [](Engine& engine) { //back to the starting position
+            py::gil_scoped_release release;
+            engine.set_position(Board());
+        })
+        .def("push", [](Engine& engine, int code) {
+            Move move = decode_move(code);
+            py::gil_scoped_release release;
+            engine.push(move);
+        }, py::arg("move"))
+        .def("pop", [](Engine& engine) {
+            py::gil_scoped_release release;
+            engine.pop();
+        })
+        .def("search", &engine_search,
+             py::arg("max_depth"), py::arg("time_ms") = 0, py::arg("threads") = 1,
+             py::arg("path_weight") = 1.0, py::arg("wall_weight") = 0.2, py::arg("wall_selection") = 0,
+             py::arg("late_move_reductions") = false, py::arg("return_stats") = false)
+        .def("stop", &Engine::stop)
+        .def("clear", [](Engine& engine) {
+            py::gil_scoped_release release;
+            engine.clear();
+        })
+        .def("resize", [](Engine& engine, int tt_mb) {
+            py::gil_scoped_release release;
+            engine.resize(tt_mb);
+        }, py::arg("tt_mb"))
+        .def("legal_moves", [](Engine& engine) {
+            Board board = engine.position();
+            std::vector<int> codes;
+            for (Move move : board.legal_moves()) {codes.push_back(encode_move(move));}
+            return codes;
+        })
+        .def_property_readonly("hash", [](const Engine& engine) {return engine.position().hash;})
+        .def_property_readonly("current_player", [](const Engine& engine) {return engine.position().current_player;})
+        .def_property_readonly("ply", &Engine::ply); //moves pushed since the position was set
+
+    m.def("bot_main", &bot_main,
+          py::arg("pawns"), py::arg("walls"), py::arg("walls_remaining"), py::arg("current_player"), py::arg("max_depth"),
+          py::arg("tt_mb") = 16, //transposition table size in megabytes
+          py::arg("time_ms") = 0, //time budget, 0 searches to max_depth without a clock
+          py::arg("threads") = 1, //search threads (Lazy SMP)
+          py::arg("path_weight") = 1.0, py::arg("wall_weight") = 0.2, //evaluation weights
+          py::arg("wall_selection") = 0, //0 searches every wall, 1 searches irrelevant walls shallower, 2 prunes them
+          py::arg("late_move_reductions") = false, //search late wall moves shallower first
+          py::arg("return_stats") = false); //return (move, SearchStats) instead of just the move
+    m.def("stop_search", &stop_search);
+    m.def("clear_tt", &clear_tt);
+    m.def("position_hash", &position_hash, py::arg("pawns"), py::arg("walls"), py::arg("walls_remaining"), py::arg("current_player"));
+    m.def("perft", &perft_main, py::arg("pawns"), py::arg("walls"), py::arg("walls_remaining"), py::arg("current_player"), py::arg("depth"));
+    m.def("evaluate_batch", &evaluate_batch,
+          py::arg("pawns"), py::arg("walls"), py::arg("walls_remaining"), py::arg("current_player"),
+          py::arg("depth") = 0, //0 for the static evaluation, otherwise a fixed depth search per position
+          py::arg("threads") = 0, //0 uses every core
+          py::arg("tt_mb") = 4, //transposition table size per thread
+          py::arg("path_weight") = 1.0, py::arg("wall_weight") = 0.2);
+    m.def("benchmark_movegen", &benchmark_movegen,
+          py::arg("pawns"), py::arg("walls"), py::arg("walls_remaining"), py::arg("current_player"), py::arg("iterations") = 1000);
+    m.def("benchmark_search", &benchmark_search,
+          py::arg("pawns"), py::arg("walls"), py::arg("walls_remaining"), py::arg("current_player"), py::arg("depth"), py::arg("threads") = 1);
+}
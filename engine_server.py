@@ -0,0 +1,312 @@
+#Standalone engine process speaking a line based protocol in the spirit of UCI, for hosting many games at once
+#   python engine_server.py                       one game over stdin/stdout
+#   python engine_server.py --port 7777           one game per TCP connection on localhost
+#
+#Commands (one per line, replies are sent as lines too):
+#   isready                                 -> readyok
+#   position startpos [moves M1 M2 ...]     set the game, replaying the moves from the starting position
+#   go [depth D] [time MS]                  search the position -> info ... (score from player 1's point of view),
+#                                           then bestmove M
+#   stop                                    end the running search early, it still replies with bestmove
+#   stats                                   -> stats ... for the last finished search
+#   quit                                    end the session
+#Moves are written as row and column digits: "74" is a pawn move to (7, 4), "34h" / "34v" a wall (3, 4, "H"/"V").
+#Anything wrong is answered with "error <reason>".
+#
+#Searches run in a pool of worker processes, so one long search never holds up the other games. Each worker keeps
+#its own bot_cpp.Engine, and with it a transposition table shared by every game it searches.
+import argparse
+import asyncio
+import multiprocessing
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from board import Board, encode_move, decode_move
+
+MAX_DEPTH = 64 #depth limit of a go with only a time budget
+STATS_FIELDS = ["completed_depth", "nodes", "seconds", "nodes_per_second", "score", "leaf_evaluations", "bfs_calls",
+                "beta_cutoffs", "tt_hits", "tt_cutoffs", "races_solved"]
+
+def format_move(move):
+    if len(move) == 2:
+        return f"{move[0]}{move[1]}"
+    return f"{move[0]}{move[1]}{move[2].lower()}"
+
+def parse_move(text):
+    #inverse of format_move. Raises ValueError for anything that is not a move on the board
+    if len(text) in (2, 3) and text[:2].isdigit():
+        row, col = int(text[0]), int(text[1])
+        if len(text) == 2 and row < 9 and col < 9:
+            return (row, col)
+        if len(text) == 3 and text[2] in "hvHV" and 1 <= row <= 8 and col < 8:
+            return (row, col, text[2].upper())
+    raise ValueError(f"Not a move: {text}")
+
+def parse_go(words):
+    #"depth 6 time 500" -> search options for a worker. Raises ValueError for anything else
+    options = {"max_depth": None, "time_ms": 0}
+    names = {"depth": "max_depth", "time": "time_ms"}
+    if len(words) % 2:
+        raise ValueError("go takes depth and/or time followed by a number")
+    for name, value in zip(words[::2], words[1::2]):
+        if name not in names or not value.isdigit():
+            raise ValueError(f"Invalid go option: {name} {value}")
+        options[names[name]] = int(value)
+
+    if options["max_depth"] is None:
+        if options["time_ms"] == 0:
+            raise ValueError("go needs a depth or a time")
+        options["max_depth"] = MAX_DEPTH
+    if options["max_depth"] < 1:
+        raise ValueError("depth must be at least 1")
+    return options
+
+#Worker processes
+def watch_for_stop(engine, stop, done):
+    #stop the engine once the front end asks to. Once is enough, as a stop sent before the search starts still ends it
+    while not done.wait(0.005):
+        if stop.is_set():
+            engine.stop()
+            return
+
+def worker_main(connection, stop, tt_mb):
+    #search loop of a worker process: receive (move codes, options), reply with the search result
+    try:
+        from bot_cpp import Engine
+    except ImportError: #bot_cpp is not built for this platform
+        from python_engine import Engine
+    engine = Engine(tt_mb)
+    while True:
+        try:
+            codes, options = connection.recv()
+        except EOFError: #the front end has gone
+            return
+
+        engine.reset()
+        for code in codes:
+            engine.push(code) #already checked by the front end
+
+        done = threading.Event()
+        watcher = threading.Thread(target=watch_for_stop, args=(engine, stop, done), daemon=True)
+        watcher.start()
+        code, stats = engine.search(options["max_depth"], time_ms=options["time_ms"], return_stats=True)
+        done.set()
+        watcher.join()
+
+        result = {field: getattr(stats, field) for field in STATS_FIELDS}
+        result["move"] = code
+        result["principal_variation"] = [encode_move(move) for move in stats.principal_variation]
+        connection.send(result)
+
+class Worker:
+    def __init__(self, tt_mb):
+        self.connection, child = multiprocessing.Pipe()
+        self.stop_event = multiprocessing.Event()
+        self.process = multiprocessing.Process(target=worker_main, args=(child, self.stop_event, tt_mb), daemon=True)
+        self.process.start()
+
+    def search(self, codes, options):
+        #blocking, so the front end runs it on a thread. Raises EOFError if the worker process died
+        self.connection.send((codes, options))
+        return self.connection.recv()
+
+    def stop(self):
+        self.stop_event.set()
+
+    def close(self):
+        self.connection.close()
+        self.process.join(1)
+
+class WorkerPool:
+    #hands out idle workers. A search waits here when every worker is busy
+    def __init__(self, workers, tt_mb):
+        self.tt_mb = tt_mb
+        self.workers = [Worker(tt_mb) for _ in range(workers)]
+        self.idle = asyncio.Queue()
+        for worker in self.workers:
+            self.idle.put_nowait(worker)
+        self.threads = ThreadPoolExecutor(max_workers=workers) #one blocking Worker.search per worker
+
+    async def search(self, codes, options, session):
+        worker = await self.idle.get()
+        try:
+            if session.stop_requested: #stopped while waiting for a worker, so just find a legal move
+                options = dict(options, max_depth=1, time_ms=0)
+            worker.stop_event.clear() #before the session can see the worker, so a stop from now on is never lost
+            session.worker = worker
+            return await asyncio.get_running_loop().run_in_executor(self.threads, worker.search, codes, options)
+        finally:
+            session.worker = None
+            if not worker.process.is_alive(): #replace a crashed worker so the pool keeps its size
+                self.workers.remove(worker)
+                worker = Worker(self.tt_mb)
+                self.workers.append(worker)
+            self.idle.put_nowait(worker)
+
+    def close(self):
+        for worker in self.workers:
+            worker.close()
+        self.threads.shutdown(wait=False)
+
+#Sessions: one game each
+class Session:
+    def __init__(self, pool, write):
+        self.pool = pool
+        self.write = write #sends one reply line
+        self.board = Board()
+        self.codes = []
+        self.search_task = None
+        self.worker = None
+        self.stop_requested = False
+        self.last_result = None
+
+    def searching(self):
+        return self.search_task is not None and not self.search_task.done()
+
+    def handle(self, line):
+        #run one command. Returns False once the session should end
+        words = line.split()
+        if not words:
+            return True
+        command, arguments = words[0], words[1:]
+        try:
+            if command == "quit":
+                self.stop()
+                return False
+            elif command == "isready":
+                self.write("readyok")
+            elif command == "position":
+                self.set_position(arguments)
+            elif command == "go":
+                self.go(arguments)
+            elif command == "stop":
+                self.stop()
+            elif command == "stats":
+                self.send_stats()
+            else:
+                raise ValueError(f"Unknown command: {command}")
+        except ValueError as error:
+            self.write(f"error {error}")
+        return True
+
+    def set_position(self, words):
+        if self.searching():
+            raise ValueError("Cannot change the position during a search")
+        if not words or words[0] != "startpos" or (len(words) > 1 and words[1] != "moves"):
+            raise ValueError("Expected: position startpos [moves M1 M2 ...]")
+
+        board = Board()
+        codes = []
+        for text in words[2:]:
+            move = parse_move(text)
+            if board.game_over:
+                raise ValueError(f"The game is already over before {text}")
+            try:
+                board.apply_move(move)
+            except ValueError:
+                raise ValueError(f"Illegal move: {text}")
+            codes.append(encode_move(move))
+        self.board = board
+        self.codes = codes
+
+    def go(self, words):
+        if self.searching():
+            raise ValueError("Already searching")
+        if self.board.game_over:
+            raise ValueError("The game is over")
+        options = parse_go(words)
+        self.stop_requested = False
+        self.search_task = asyncio.get_running_loop().create_task(self.search(list(self.codes), options))
+
+    async def search(self, codes, options):
+        try:
+            result = await self.pool.search(codes, options, self)
+        except (EOFError, OSError):
+            self.write("error The search worker stopped unexpectedly")
+            return
+        self.last_result = result
+        pv = " ".join(format_move(decode_move(code)) for code in result["principal_variation"])
+        self.write(f"info depth {result['completed_depth']} score {result['score']:.2f} nodes {result['nodes']} "
+                   f"time {round(1000 * result['seconds'])} pv {pv}")
+        self.write(f"bestmove {format_move(decode_move(result['move']))}")
+
+    def stop(self):
+        if self.searching():
+            self.stop_requested = True
+            if self.worker is not None:
+                self.worker.stop()
+
+    def send_stats(self):
+        if self.last_result is None:
+            raise ValueError("No search has finished yet")
+        self.write("stats " + " ".join(f"{field} {self.last_result[field]}" for field in STATS_FIELDS))
+
+    async def finish(self):
+        #wait for a stopped search so its worker goes back to the pool
+        if self.search_task is not None:
+            await self.search_task
+
+#Front ends
+async def serve_stdio(pool):
+    def write(line):
+        sys.stdout.write(line + "\n")
+        sys.stdout.flush()
+
+    session = Session(pool, write)
+    loop = asyncio.get_running_loop()
+    while True:
+        line = await loop.run_in_executor(None, sys.stdin.readline) #portable, unlike reading stdin as a pipe
+        if not line or not session.handle(line):
+            break
+    session.stop()
+    await session.finish()
+
+async def serve_tcp(pool, host, port):
+    async def client(reader, writer):
+        def write(line):
+            if not writer.is_closing():
+                writer.write((line + "\n").encode())
+
+        session = Session(pool, write)
+        try:
+            while True:
+                line = await reader.readline()
+                if not line or not session.handle(line.decode(errors="replace")):
+                    break
+                await writer.drain()
+        except ConnectionError:
+            pass
+        session.stop()
+        await session.finish()
+        writer.close()
+
+    server = await asyncio.start_server(client, host, port)
+    print(f"Engine server listening on {host}:{port}", file=sys.stderr, flush=True)
+    async with server:
+        await server.serve_forever()
+
+async def run(args):
+    pool = WorkerPool(args.workers, args.tt_mb)
+    try:
+        if args.port is None:
+            await serve_stdio(pool)
+        else:
+            await serve_tcp(pool, args.host, args.port)
+    finally:
+        pool.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the engine over a line protocol on stdin/stdout or a local socket")
+    parser.add_argument("--port", type=int, default=None, help="serve TCP connections on this port instead of stdin/stdout")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--workers", type=int, default=multiprocessing.cpu_count(), help="search processes")
+    parser.add_argument("--tt-mb", type=int, default=64, help="transposition table size per worker")
+    args = parser.parse_args()
+    try:
+        asyncio.run(run(args))
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
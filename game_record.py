@@ -0,0 +1,148 @@
+#Game records: whole games stored in one byte per move, written as they are played and read back lazily
+#   python game_record.py games.qgr              summary of every game in a record file
+#
+#File format:
+#   header  4s magic b"QGR1"
+#   games   one after another, each the board.encode_move code of every move from the starting position (0-208),
+#           a result byte (RESULT_CODES) and END
+#A game cut short by a crash has no result or END and is read back as unfinished. The next GameWriter to open the file
+#ends it as unfinished before appending, so it never runs into the next game. Files are only ever appended to,
+#and the reader memory-maps them so multi GB corpora are never loaded into RAM as a whole.
+import argparse
+import mmap
+
+from board import Board, encode_move, decode_move
+
+MAGIC = b"QGR1"
+END = 0xFF
+RESULT_CODES = {0: 0xF0, 1: 0xF1, None: 0xF2} #winner (None for a game stopped before anyone won)
+RESULTS = {code: winner for winner, code in RESULT_CODES.items()}
+MOVES = [decode_move(code) for code in range(209)]
+
+class GameWriter:
+    #Appends games to a record file. Recording a board hooks it into Board.apply_move, which passes on every move:
+    #   writer = GameWriter("games.qgr")
+    #   board = Board()
+    #   writer.record(board)
+    #   board.apply_move((7, 4)) ...
+    #A game that is won ends by itself, call finish(board) for one that stops early. Only one game is recorded at once
+    def __init__(self, path):
+        self.file = open(path, "a+b") #writes always go to the end, reading is only for the last byte
+        if self.file.seek(0, 2) == 0:
+            self.file.write(MAGIC)
+        elif self.file.tell() > len(MAGIC):
+            self.file.seek(-1, 2)
+            last = self.file.read(1)[0]
+            if last != END: #a game cut short by a crash, end it before appending the next
+                self.file.write(bytes((END,)) if last in RESULTS else bytes((RESULT_CODES[None], END)))
+                self.file.flush()
+        self.board = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def record(self, board):
+        if self.board is not None:
+            raise ValueError("Already recording a game")
+        if board.pawns != [(8, 4), (0, 4)] or board.walls or board.current_player != 0:
+            raise ValueError("Games are recorded from the starting position")
+        self.board = board
+        board.recorder = self
+
+    def record_move(self, board, move):
+        #called by Board.apply_move after each legal move
+        self.file.write(bytes((encode_move(move),)))
+        if board.game_over:
+            self.finish(board)
+
+    def finish(self, board):
+        #end the game with its result (an unfinished game if nobody has won) and stop recording the board
+        if board is not self.board:
+            return
+        self.file.write(bytes((RESULT_CODES[board.winner], END)))
+        self.file.flush() #complete games reach the file even if the program dies later
+        board.recorder = None
+        self.board = None
+
+    def write_game(self, moves, winner):
+        #append an already played game, e.g. one played in another process
+        if self.board is not None:
+            raise ValueError("A recorded game is in progress")
+        self.file.write(bytes([encode_move(move) for move in moves] + [RESULT_CODES[winner], END]))
+
+    def close(self):
+        if self.board is not None:
+            self.finish(self.board)
+        self.file.close()
+
+class GameRecord:
+    __slots__ = ("codes", "winner", "finished")
+
+    def __init__(self, codes, winner, finished=True):
+        self.codes = codes #raw move codes, decoded only when asked for
+        self.winner = winner
+        self.finished = finished #False for a game cut short without a result
+
+    def __len__(self):
+        return len(self.codes)
+
+    @property
+    def moves(self):
+        return [MOVES[code] for code in self.codes]
+
+    def positions(self):
+        #every position of the game from the start, replayed lazily on one Board that is changed in place between
+        #yields (copy it to keep a position). Raises ValueError if the record holds an illegal move
+        board = Board()
+        yield board
+        for code in self.codes:
+            board.apply_move(MOVES[code])
+            yield board
+
+def read_games(path):
+    #generator of the GameRecords in a record file, in the order they were written
+    with open(path, "rb") as file:
+        try:
+            data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError: #an empty file cant be mapped
+            raise ValueError(f"{path} is not a game record file")
+
+        with data:
+            if data[:len(MAGIC)] != MAGIC:
+                raise ValueError(f"{path} is not a game record file")
+
+            start = len(MAGIC)
+            while start < len(data):
+                end = data.find(bytes((END,)), start)
+                if end < 0: #the last game was never finished
+                    yield GameRecord(data[start:], None, finished=False)
+                    return
+                if end == start or data[end - 1] not in RESULTS:
+                    raise ValueError(f"Corrupt game record at byte {end}")
+                yield GameRecord(data[start:end - 1], RESULTS[data[end - 1]])
+                start = end + 1
+
+def main():
+    parser = argparse.ArgumentParser(description="Summarise a game record file")
+    parser.add_argument("path")
+    args = parser.parse_args()
+
+    games = plies = unfinished = 0
+    wins = [0, 0]
+    for game in read_games(args.path):
+        games += 1
+        plies += len(game)
+        if game.winner is None:
+            unfinished += 1
+        else:
+            wins[game.winner] += 1
+
+    print(f"Games: {games}  Player 1 wins: {wins[0]}  Player 2 wins: {wins[1]}  Unfinished: {unfinished}")
+    if games:
+        print(f"Average game length: {plies / games:.1f} plies")
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,14 @@
 #Imports and constants
 import pygame
 
+BACKGROUND_COLOUR = (240, 240, 240)
+
 class Graphics:
+    #Draws the game in layers so a frame only costs anything when something changed:
+    #   background  grid and the fixed parts of the sidebar, drawn once
+    #   board layer background plus pawns, walls and wall counts, redrawn only when the position changes
+    #   overlays    legal moves, messages, the ghost wall and the win screen, drawn over the board layer
+    #render() works out which screen areas changed since the last frame and repaints only those
     def __init__(self, screen, font, cell_size, sidebar_width, gap):
         # Use screen and font provided by main.py to keep single display
         self.screen = screen
@@ -13,31 +20,92 @@ class Graphics:
         self.gap = gap
         self.clock = pygame.time.Clock()
 
-    def draw_grid(self): #draws the 9x9 grid
+        self.background = pygame.Surface((self.width, self.height)).convert()
+        self.background.fill(BACKGROUND_COLOUR)
+        self.draw_grid(self.background)
+        self.draw_sidebar(self.background)
+
+        self.board_layer = None
+        self.board_key = None #position the board layer shows
+        self.shown = {} #overlay name -> (state, screen rects it covers) as last drawn
+        self.text_cache = {}
+
+    def invalidate(self): #repaint everything on the next render, e.g. after the window was covered
+        self.board_key = None
+
+    def render(self, board, legal_moves=(), error_message="", thinking_ms=None, dragging_wall=None, winner=None, mode=None):
+        #bring the screen up to date and return the rects that changed, for pygame.display.update
+        dirty = []
+        board_key = (tuple(board.pawns), len(board.walls), tuple(board.walls_remaining))
+        if board_key != self.board_key: #walls are only ever added so their count tells if they changed
+            self.board_layer = self.background.copy()
+            self.draw_pawns(self.board_layer, board)
+            self.draw_walls(self.board_layer, board)
+            self.draw_wall_counts(self.board_layer, board)
+            self.board_key = board_key
+            dirty.append(self.screen.get_rect())
+
+        thinking = self.thinking_text(thinking_ms)
+        ghost_wall = self.ghost_wall_rect(dragging_wall)
+        overlays = { #what each overlay shows now and where
+            "legal_moves": (tuple(legal_moves), [self.legal_move_rect(square) for square in legal_moves]),
+            "error": (error_message, [self.text_rect(error_message, 220)] if error_message else []),
+            "thinking": (thinking, [self.text_rect(line, 280 + 30 * i) for i, line in enumerate(thinking)]),
+            "ghost_wall": (ghost_wall, [ghost_wall] if ghost_wall else []),
+            "win": ((winner, mode), [self.screen.get_rect()] if winner is not None else []),
+        }
+        for name, (state, rects) in overlays.items():
+            old_state, old_rects = self.shown.get(name, (None, []))
+            if state != old_state:
+                dirty.extend(old_rects + rects)
+                self.shown[name] = (state, rects)
+
+        dirty = [rect.clip(self.screen.get_rect()) for rect in dirty]
+        dirty = [rect for rect in dirty if rect.width and rect.height]
+        if not dirty:
+            return []
+        if self.screen.get_rect() in dirty:
+            dirty = [self.screen.get_rect()]
+
+        for rect in dirty:
+            self.screen.set_clip(rect)
+            self.screen.blit(self.board_layer, rect, rect)
+            self.draw_legal_moves(legal_moves)
+            if error_message:
+                self.blit_text(error_message, 220, (200, 0, 0))
+            for i, line in enumerate(thinking):
+                self.blit_text(line, 280 + 30 * i, (0, 0, 150) if i == 0 else (80, 80, 80))
+            if ghost_wall:
+                pygame.draw.rect(self.screen, (150, 150, 150), ghost_wall)
+            self.draw_win_message(winner, mode)
+        self.screen.set_clip(None)
+        return dirty
+
+    def draw_grid(self, surface): #draws the 9x9 grid
         for row in range(9):
             for col in range(9):
                 rect = pygame.Rect(col * self.cell_size, row * self.cell_size, self.cell_size, self.cell_size)
-                pygame.draw.rect(self.screen, (200, 200, 200), rect, 1)
+                pygame.draw.rect(surface, (200, 200, 200), rect, 1)
 
-    def draw_pawns(self, board): #draw the player pawns as circles
+    def draw_pawns(self, surface, board): #draw the player pawns as circles
         for player in range(2):
             row, col = board.pawns[player]
             color = (200, 50, 50) if player == 0 else (50, 50, 200)
             pygame.draw.circle(
-                self.screen, color,
+                surface, color,
                 (col * self.cell_size + self.cell_size // 2, row * self.cell_size + self.cell_size // 2),
                 self.cell_size // 3
             )
 
-    def draw_walls(self, board): #draw both horizontal and vertical walls
+    def draw_walls(self, surface, board): #draw both horizontal and vertical walls
         thickness = self.cell_size // 6
         for (r, c, orientation) in board.walls:
             if orientation == "H":
                 #Horizontal wall: starts at the top-left corner of (r,c) and extends two squares to the right
                 rect = pygame.Rect(
-                    (c) * self.cell_size + self.gap, 
-                    (r) * self.cell_size - thickness//2, 
-                    2*self.cell_size - 2*self.gap, 
+                    (c) * self.cell_size + self.gap,
+                    (r) * self.cell_size - thickness//2,
+                    2*self.cell_size - 2*self.gap,
                     thickness
                 )
 
@@ -46,33 +114,52 @@ class Graphics:
                 rect = pygame.Rect(
                     (c + 1) * self.cell_size - thickness//2,
                     (r - 1) * self.cell_size + self.gap,
-                    thickness, 
+                    thickness,
                     2*self.cell_size - 2*self.gap
                     )
-            pygame.draw.rect(self.screen, (100, 100, 100), rect)
+            pygame.draw.rect(surface, (100, 100, 100), rect)
 
-    def draw_sidebar(self, board, error_message): #sidebar displays wall counts
+    def draw_sidebar(self, surface): #the parts of the sidebar that never change
         sidebar_rect = pygame.Rect(self.cell_size * 9, 0, self.sidebar_width, self.height)
-        pygame.draw.rect(self.screen, (220, 220, 220), sidebar_rect)
+        pygame.draw.rect(surface, (220, 220, 220), sidebar_rect)
+
+        #Wall selectors that you can drag
+        pygame.draw.rect(surface, (100, 100, 100), (self.cell_size * 9 + 50, 80, 2 * self.cell_size, self.cell_size // 6))
+        pygame.draw.rect(surface, (100, 100, 100), (self.cell_size * 9 + 50, 150, self.cell_size // 6, 2 * self.cell_size))
 
+    def draw_wall_counts(self, surface, board): #sidebar displays wall counts
         text = self.font.render(f"P1 Walls: {board.walls_remaining[0]}", True, (0, 0, 0))
-        self.screen.blit(text, (self.cell_size * 9 + 10, 10))
+        surface.blit(text, (self.cell_size * 9 + 10, 10))
 
         text = self.font.render(f"P2 Walls: {board.walls_remaining[1]}", True, (0, 0, 0))
-        self.screen.blit(text, (self.cell_size * 9 + 10, 40))
-
-        #Wall selectors that you can drag
-        pygame.draw.rect(self.screen, (100, 100, 100), (self.cell_size * 9 + 50, 80, 2 * self.cell_size, self.cell_size // 6))
-        pygame.draw.rect(self.screen, (100, 100, 100), (self.cell_size * 9 + 50, 150, self.cell_size // 6, 2 * self.cell_size))
-
-        if error_message: #display error message if there is one
-            txt = self.font.render(error_message, True, (200, 0, 0))
-            self.screen.blit(txt, (self.cell_size * 9 + 10, 220))
+        surface.blit(text, (self.cell_size * 9 + 10, 40))
+
+    def thinking_text(self, elapsed_ms): #shown in the sidebar while the bot searches in the background
+        if elapsed_ms is None:
+            return ()
+        dots = "." * (1 + (elapsed_ms // 400) % 3)
+        return (f"Bot thinking {elapsed_ms / 1000:.1f}s{dots}", "Esc: move now")
+
+    def render_text(self, text, colour):
+        #rendered text is kept, as the same few messages come up again and again
+        key = (text, colour)
+        if key not in self.text_cache:
+            if len(self.text_cache) > 256:
+                self.text_cache.clear()
+            self.text_cache[key] = self.font.render(text, True, colour)
+        return self.text_cache[key]
+
+    def text_rect(self, text, y): #area a sidebar line of text covers
+        width, height = self.font.size(text)
+        return pygame.Rect(self.cell_size * 9 + 10, y, width, height)
+
+    def blit_text(self, text, y, colour):
+        self.screen.blit(self.render_text(text, colour), (self.cell_size * 9 + 10, y))
 
     def draw_win_message(self, winner, mode): #display the win message with a nice dark overlay
         if winner is None:
             return
-        
+
         overlay = pygame.Surface((self.width, self.height))
         overlay.set_alpha(180)
         overlay.fill((0, 0, 0))
@@ -102,13 +189,19 @@ class Graphics:
         text_rect = win_text.get_rect(center=(self.width // 2, self.height // 2))
         self.screen.blit(win_text, text_rect)
 
+    def legal_move_rect(self, square): #area of a legal move marker
+        row, col = square
+        radius = self.cell_size // 6
+        return pygame.Rect(col * self.cell_size + self.cell_size // 2 - radius, row * self.cell_size + self.cell_size // 2 - radius,
+                           2 * radius + 1, 2 * radius + 1)
+
     def draw_legal_moves(self, legal_moves): #highlights the squares the selected pawn can move to in green
         for row, col in legal_moves:
             pygame.draw.circle(self.screen, (0, 200, 0), (col * self.cell_size + self.cell_size // 2, row * self.cell_size + self.cell_size // 2), self.cell_size // 6)
 
-    def draw_ghost_wall(self, dragging_wall):
+    def ghost_wall_rect(self, dragging_wall): #where the wall being dragged would go, following the mouse
         if not dragging_wall:
-            return
+            return None
         mx, my = pygame.mouse.get_pos()
         col = mx // self.cell_size
         row = my // self.cell_size
@@ -117,11 +210,9 @@ class Graphics:
         if dragging_wall == "H":
             wall_x = col * self.cell_size
             wall_y = row * self.cell_size
-            rect = pygame.Rect(wall_x, wall_y, 2 * self.cell_size, self.cell_size // 6)
+            return pygame.Rect(wall_x, wall_y, 2 * self.cell_size, self.cell_size // 6)
         else:
             thickness = self.cell_size // 6
             wall_x = (col + 1) * self.cell_size - thickness
             wall_y = (row - 1) * self.cell_size
-            rect = pygame.Rect(wall_x, wall_y, thickness, 2 * self.cell_size)
-
-        pygame.draw.rect(self.screen, (150, 150, 150), rect)
+            return pygame.Rect(wall_x, wall_y, thickness, 2 * self.cell_size)
@@ -1,8 +1,15 @@
 #Imports and initialisation
+import threading
+import traceback
 import pygame
-from board import Board
-from bot_cpp import bot_main
+from board import Board, encode_move, decode_move
+try:
+    from bot_cpp import Engine
+except ImportError: #bot_cpp is not built for this platform, so play with the much slower pure Python engine
+    from python_engine import Engine
+from game_record import GameWriter
 from graphics import Graphics
+from opening_book import OpeningBook
 
 pygame.init()
 
@@ -12,15 +19,24 @@ SIDEBAR_WIDTH = CELL_SIZE * 5
 WIDTH = CELL_SIZE * 9 + SIDEBAR_WIDTH
 HEIGHT = CELL_SIZE * 9
 GAP = 5
+THINKING_REFRESH_MS = 100  #how often the bot's thinking time is redrawn. Otherwise the screen is only redrawn when something changes
 
 #Bot settings
-BOT_DEPTH = 4  #bot search depth
+BOT_DEPTH = 8  #maximum bot search depth
+BOT_TIME_MS = 2000  #time budget per bot move in milliseconds, 0 searches to exactly BOT_DEPTH
+BOT_MIN_DELAY_MS = 200  #a bot move is never shown sooner than this after the bot starts thinking
+BOT_VS_BOT_MIN_DELAY_MS = 500  #slower in bot v bot so the game can be followed
+BOT_WALL_SELECTION = 0  #0 searches every wall, 1 searches walls away from the paths and pawns shallower, 2 skips them
+BOT_LATE_MOVE_REDUCTIONS = False  #search late wall moves shallower first
+BOT_PONDER = True  #in human v bot, search the expected reply while the human thinks
+OPENING_BOOK_PATH = "opening_book.bin"  #optional, generate it with opening_book.py
+GAME_RECORD_PATH = None  #set to a file name to append every game played to it (see game_record.py)
 
 #Pygame screen setup
 screen = pygame.display.set_mode((WIDTH, HEIGHT))
 pygame.display.set_caption("Quoridor")
 font = pygame.font.SysFont(None, 36)
-clock = pygame.time.Clock() #used to cap FPS
+BOT_DONE_EVENT = pygame.USEREVENT #posted when a search finishes so the waiting game loop wakes up
 
 #Game state variables
 board = Board()
@@ -36,13 +52,156 @@ graphics = Graphics(screen, font, CELL_SIZE, SIDEBAR_WIDTH, GAP)
 mode = None  #0 for human v human, 1 for human v bot, 2 for bot v human, 3 for bot v bot
 human_player = 0  #0 or 1 - just tracks which player is the human when doing human v bot or bot v human
 
+#The engine follows the game move by move so its search state carries over from one bot move to the next
+engine = Engine()
+
+def play_move(move):
+    #apply a move to the engine and the board. Raises ValueError, with neither changed, if it is illegal
+    engine.push(encode_move(move)) #checks the move before changing anything
+    try:
+        board.apply_move(move)
+    except ValueError: #only if the two ever disagree about a move, keep them in step
+        engine.pop()
+        raise
+
+#Bot worker
+class BotWorker:
+    #runs the engine search on a background thread so the game loop keeps handling events while the bot thinks
+    #(the search releases the GIL)
+    def __init__(self):
+        self.thread = None
+        self.move = None
+        self.started_at = 0
+        self.prediction = None #the reply the last search expects from the opponent (second move of its principal variation)
+        self.pondering = None #the predicted reply being searched on the opponent's time, already pushed to the engine
+        self.stop_at = None #ticks at which a ponder search that became the bot's own search is stopped
+        self.failed = False #the last search raised, so its move is just the first legal one
+
+    def start(self, board, time_ms=BOT_TIME_MS):
+        #snapshot the state so the search never sees the board change under it
+        pawns, walls, walls_remaining, current_player = board.export_state_for_bot()
+        state = (list(pawns), walls, list(walls_remaining), current_player)
+
+        fallback = board.legal_pawn_moves()[0] #played if the search fails, so the bot's turn always ends
+
+        self.move = None
+        self.prediction = None
+        self.failed = False
+        self.started_at = pygame.time.get_ticks()
+        self.thread = threading.Thread(target=self.run, args=(state, time_ms, fallback), daemon=True)
+        self.thread.start()
+
+    def run(self, state, time_ms, fallback):
+        try:
+            move = opening_book.lookup(*state) if opening_book else None #book positions need no search
+            if move:
+                self.move = move
+            else:
+                code, stats = engine.search(BOT_DEPTH, time_ms=time_ms, wall_selection=BOT_WALL_SELECTION,
+                                            late_move_reductions=BOT_LATE_MOVE_REDUCTIONS, return_stats=True)
+                if len(stats.principal_variation) > 1:
+                    self.prediction = stats.principal_variation[1]
+                self.move = decode_move(code)
+        except Exception:
+            traceback.print_exc()
+            self.prediction = None
+            self.move = fallback
+            self.failed = True
+        finally:
+            pygame.event.post(pygame.event.Event(BOT_DONE_EVENT))
+
+    def ponder(self, board):
+        #after the bot's move, play the predicted reply on the engine and search it until the opponent moves.
+        #There is no clock yet, so it runs to BOT_DEPTH unless the opponent plays something else first
+        prediction = self.prediction
+        if prediction is None or board.game_over:
+            return
+        try:
+            engine.push(encode_move(prediction))
+        except ValueError:
+            return
+        predicted = board.copy()
+        predicted.apply_move(prediction)
+        self.start(predicted, time_ms=0)
+        self.pondering = prediction
+
+    def ponder_hit(self):
+        #the opponent played the predicted move, so the ponder search carries on as the bot's search (the engine already
+        #has the move pushed). Time spent pondering counts against the usual budget, which started with the ponder search,
+        #so a search that pondered longer than that is stopped straight away by take_move
+        self.pondering = None
+        if BOT_TIME_MS > 0 and self.is_thinking():
+            self.stop_at = self.started_at + BOT_TIME_MS
+
+    def stop_pondering(self):
+        #the opponent played something else - end the ponder search and take the predicted move back off the engine
+        if self.pondering is None:
+            return
+        engine.stop() #ends the search even if it has not started yet
+        self.thread.join()
+        engine.pop()
+        self.thread = None
+        self.move = None
+        self.pondering = None
+
+    def is_thinking(self):
+        return self.thread is not None and self.thread.is_alive()
+
+    def take_move(self, min_delay):
+        #return the finished move once at least min_delay ms have passed since the search started, otherwise None
+        if self.stop_at is not None and pygame.time.get_ticks() >= self.stop_at:
+            engine.stop()
+            self.stop_at = None
+        if self.thread is None or self.is_thinking():
+            return None
+        if pygame.time.get_ticks() - self.started_at < min_delay:
+            return None
+        move = self.move
+        self.thread = None
+        self.move = None
+        self.stop_at = None
+        return move
+
+    def cancel(self):
+        #stop the search early - the bot plays the best move found so far
+        if self.is_thinking() and self.pondering is None:
+            engine.stop()
+
+    def elapsed(self):
+        return pygame.time.get_ticks() - self.started_at
+
+opening_book = OpeningBook.open_if_exists(OPENING_BOOK_PATH)
+bot = BotWorker()
+
+def is_bot_turn():
+    return mode == 3 or ((mode == 1 or mode == 2) and board.current_player != human_player)
+
+def wait_for_events(timeout):
+    #sleep until there is an event or timeout ms have passed (None waits for an event however long it takes),
+    #then return every pending event. This keeps the game loop from using the CPU while nothing happens
+    event = pygame.event.wait() if timeout is None else pygame.event.wait(timeout)
+    events = [] if event.type == pygame.NOEVENT else [event]
+    return events + pygame.event.get()
+
+def play_human_move(move):
+    #like play_move, but a move the bot is pondering is already on the engine and any other move ends the ponder search
+    if bot.pondering is None:
+        play_move(move)
+    elif move == bot.pondering:
+        board.apply_move(move)
+        bot.ponder_hit()
+    else:
+        board.apply_move(move) #raises ValueError for an illegal move while the ponder search keeps going
+        bot.stop_pondering()
+        engine.push(encode_move(move))
+
 #Starting screen
 def start_screen():
     global mode, human_player
 
     selecting = True
 
-    while selecting:
+    while selecting: #redrawn only when an event arrives
         screen.fill((240,240,240))
         title = font.render("Quoridor", True, (0,0,0))
         screen.blit(title, (WIDTH//2 - 60, 50))
@@ -55,7 +214,7 @@ def start_screen():
             screen.blit(txt, (WIDTH//2 - txt.get_width()//2, 150 + i*100 + 15))
         pygame.display.flip()
 
-        for event in pygame.event.get():
+        for event in wait_for_events(None):
             if event.type == pygame.QUIT:
                 pygame.quit()
                 exit()
@@ -71,12 +230,14 @@ def start_screen():
 #Main game loop
 start_screen()
 
+recorder = GameWriter(GAME_RECORD_PATH) if GAME_RECORD_PATH else None
+if recorder:
+    recorder.record(board) #the board passes every move on from now, the game ends up in the file when it is won
+
 running = True
 winner = None  #Track winner to freeze input
 
 while running:
-    clock.tick(60)
-
     #Check winner
     if board.is_winner(0):
         winner = 0
@@ -94,27 +255,53 @@ while running:
         legal_moves = []
         dragging_wall = None
 
-    #Bot turn
-    if not winner:
-        if mode == 3:
-            #Both players are bots
-            move = bot_main(*board.export_state_for_bot(), BOT_DEPTH)
-            board.apply_move(move)
-            
-            pygame.time.delay(500)  #add delay for bot
-
-        elif (mode == 1 or mode == 2) and board.current_player != human_player: #if its a human-bot mode and its the bot's turn to move
-            move = bot_main(*board.export_state_for_bot(), BOT_DEPTH)
+    #Bot turn - start a search in the background, then apply its move once it is ready
+    bot_turn = winner is None and is_bot_turn()
+    bot_moved = False
+    min_delay = BOT_VS_BOT_MIN_DELAY_MS if mode == 3 else BOT_MIN_DELAY_MS
+    if bot_turn:
+        if bot.thread is None:
+            bot.start(board)
+        else:
+            move = bot.take_move(min_delay)
             if move:
-                board.apply_move(move)
-
-            pygame.time.delay(200)
-
-    for event in pygame.event.get():
+                if bot.failed:
+                    error_message = "Bot search failed, it played a legal move"
+                play_move(move)
+                bot_moved = True
+                bot_turn = is_bot_turn()
+                if BOT_PONDER and mode in (1, 2):
+                    bot.ponder(board)
+
+    #Drawing - only the parts of the screen that changed since the last frame are redrawn
+    thinking_ms = bot.elapsed() if bot.is_thinking() and bot.pondering is None else None #pondering happens quietly on the human's turn
+    dirty_rects = graphics.render(board, legal_moves, error_message, thinking_ms,
+                                  dragging_wall if winner is None else None, winner, mode)
+    if dirty_rects:
+        pygame.display.update(dirty_rects)
+
+    #Wait for input, the bot finishing its search or the next thinking timer update. After a bot move the loop goes
+    #straight round again to check for a winner and start the next search
+    if bot_moved:
+        events = pygame.event.get()
+    elif bot_turn:
+        events = wait_for_events(THINKING_REFRESH_MS if bot.is_thinking() else max(1, min_delay - bot.elapsed()))
+    else:
+        events = wait_for_events(None)
+
+    for event in events:
         if event.type == pygame.QUIT:
+            bot.cancel()
+            bot.stop_pondering()
             running = False
 
-        elif event.type == pygame.MOUSEBUTTONDOWN and not winner and mode != 3:
+        elif event.type == pygame.KEYDOWN and event.key == pygame.K_ESCAPE:
+            bot.cancel()
+
+        elif event.type in (pygame.VIDEOEXPOSE, pygame.WINDOWEXPOSED): #the window contents were lost
+            graphics.invalidate()
+
+        elif event.type == pygame.MOUSEBUTTONDOWN and not winner and not bot_turn:
             mx, my = event.pos
 
             col = mx // CELL_SIZE
@@ -136,11 +323,11 @@ while running:
             #Clicking on legal move
             elif selected_pawn and (row, col) in legal_moves:
                 move = (row, col)
-                board.apply_move(move)
+                play_human_move(move)
                 selected_pawn = None
                 legal_moves = []
 
-        elif event.type == pygame.MOUSEBUTTONUP and not winner and mode != 3:
+        elif event.type == pygame.MOUSEBUTTONUP and not winner and not bot_turn:
 
             if dragging_wall:
                 mx, my = event.pos
@@ -148,29 +335,15 @@ while running:
                 col = mx // CELL_SIZE
                 move = (row, col, dragging_wall)
                 try:
-                    board.apply_move(move)
+                    play_human_move(move)
                     error_message = ""
                 except ValueError:
                     error_message = "Illegal wall placement!"
                 dragging_wall = None
 
-    #Drawing
-    screen.fill((240,240,240))
-    graphics.draw_grid()
-    graphics.draw_pawns(board)
-    graphics.draw_walls(board)
-    graphics.draw_sidebar(board, error_message)
-    graphics.draw_legal_moves(legal_moves)
-
-    #Draw ghost wall
-    if dragging_wall and not winner and mode != "BOT_VS_BOT":
-        graphics.draw_ghost_wall(dragging_wall)
-
-    #Draw win message last so it appears on top
-    if winner is not None:
-        graphics.draw_win_message(winner, mode)
-
-    pygame.display.flip()
-
 
+if bot.thread is not None:
+    bot.thread.join() #cancelled above so this returns as soon as the search stops
+if recorder:
+    recorder.close() #records the game as unfinished if the window was closed mid game
 pygame.quit()
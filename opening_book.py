@@ -0,0 +1,138 @@
+#Opening book: deep searches of the early positions computed offline and looked up in microseconds at runtime
+#   python opening_book.py --plies 4 --depth 5 --output opening_book.bin
+#
+#File format (little endian):
+#   header  4s magic b"QBK1", u32 entry count, u16 search depth, u16 plies
+#   entries sorted by hash, each u64 Zobrist position hash (bot_cpp.position_hash), u16 move code
+#           (board.encode_move), i16 score * 100 from player 1's point of view
+#The book is memory-mapped and binary searched, so it is never loaded into RAM as a whole.
+import argparse
+import mmap
+import multiprocessing
+import os
+import struct
+import time
+
+from board import Board, encode_move, decode_move
+try:
+    from bot_cpp import bot_main, position_hash
+except ImportError: #bot_cpp is not built for this platform. The Python hashes match so its books work with either
+    from python_engine import bot_main, position_hash
+
+MAGIC = b"QBK1"
+HEADER = struct.Struct("<4sIHH")
+ENTRY = struct.Struct("<QHh")
+
+class OpeningBook:
+    def __init__(self, path):
+        self.file = open(path, "rb")
+        try:
+            self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError: #an empty file cant be mapped
+            self.file.close()
+            raise ValueError(f"{path} is not an opening book")
+
+        magic, self.size, self.depth, self.plies = HEADER.unpack_from(self.data, 0)
+        if magic != MAGIC or HEADER.size + self.size * ENTRY.size > len(self.data):
+            self.close()
+            raise ValueError(f"{path} is not an opening book")
+
+    @classmethod
+    def open_if_exists(cls, path):
+        #the book is optional - returns None if there is no file
+        if not os.path.exists(path):
+            return None
+        return cls(path)
+
+    def close(self):
+        self.data.close()
+        self.file.close()
+
+    def __len__(self):
+        return self.size
+
+    def lookup_hash(self, key):
+        #(move, score) stored for the position hash, None if it is not in the book
+        low, high = 0, self.size
+        while low < high:
+            middle = (low + high) // 2
+            entry_key, code, score = ENTRY.unpack_from(self.data, HEADER.size + middle * ENTRY.size)
+            if entry_key < key:
+                low = middle + 1
+            elif entry_key > key:
+                high = middle
+            else:
+                return decode_move(code), score / 100
+        return None
+
+    def lookup(self, pawns, walls, walls_remaining, current_player):
+        #book move for a position exported by Board.export_state_for_bot, None if it is not in the book
+        entry = self.lookup_hash(position_hash(pawns, walls, walls_remaining, current_player))
+        return entry[0] if entry else None
+
+def search_position(task):
+    #deep search of one book position, run in a worker process
+    state, depth, tt_mb = task
+    move, stats = bot_main(*state, depth, tt_mb=tt_mb, return_stats=True)
+    return move, stats.score
+
+def generate(plies, depth, processes=None, tt_mb=64, progress=None):
+    #Search every position reachable in up to plies moves where each side plays either a pawn move or the
+    #book move of the position before (so walls only enter the book when the engine itself plays them).
+    #Returns {position hash: (move, score)}
+    book = {}
+    level = [Board()]
+    seen = {position_hash(*level[0].export_state_for_bot())}
+
+    with multiprocessing.Pool(processes) as pool:
+        for ply in range(plies + 1):
+            states = [board.export_state_for_bot() for board in level]
+            results = pool.map(search_position, [(state, depth, tt_mb) for state in states])
+
+            next_level = []
+            for board, state, (move, score) in zip(level, states, results):
+                book[position_hash(*state)] = (move, score)
+                if ply == plies:
+                    continue
+
+                for child_move in [move] + board.legal_pawn_moves():
+                    child = board.copy()
+                    child.apply_move(child_move)
+                    if child.game_over:
+                        continue
+                    key = position_hash(*child.export_state_for_bot())
+                    if key not in seen:
+                        seen.add(key)
+                        next_level.append(child)
+
+            if progress:
+                progress(ply, len(level), len(book))
+            level = next_level
+    return book
+
+def write_book(path, book, depth, plies):
+    with open(path, "wb") as file:
+        file.write(HEADER.pack(MAGIC, len(book), depth, plies))
+        for key in sorted(book):
+            move, score = book[key]
+            file.write(ENTRY.pack(key, encode_move(move), max(-32768, min(32767, round(score * 100)))))
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate an opening book by searching the early positions deeply")
+    parser.add_argument("--plies", type=int, default=4, help="how many moves from the start the book covers")
+    parser.add_argument("--depth", type=int, default=5, help="search depth for every book position")
+    parser.add_argument("--processes", type=int, default=None, help="worker processes (default: one per core)")
+    parser.add_argument("--tt-mb", type=int, default=64, help="transposition table size per worker")
+    parser.add_argument("--output", default="opening_book.bin")
+    args = parser.parse_args()
+
+    def progress(ply, positions, total):
+        print(f"ply {ply}: searched {positions} positions ({total} in book)", flush=True)
+
+    start = time.perf_counter()
+    book = generate(args.plies, args.depth, args.processes, args.tt_mb, progress)
+    write_book(args.output, book, args.depth, args.plies)
+    print(f"Wrote {len(book)} positions to {args.output} in {time.perf_counter() - start:.1f} s")
+
+if __name__ == "__main__":
+    main()
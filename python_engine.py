@@ -0,0 +1,382 @@
+#Pure Python engine with the same interface as bot_cpp (bot_main, Engine, stop_search, clear_tt, position_hash),
+#used when the compiled extension is not built for the platform:
+#   try:
+#       from bot_cpp import bot_main
+#   except ImportError:
+#       from python_engine import bot_main
+#It searches with board.Board: iterative deepening alpha-beta with a transposition table, scored by the same
+#evaluation as bot_cpp, so it finds the same moves at a given depth, but takes roughly SPEED_RATIO times longer to
+#get there - give it a time budget. threads, late_move_reductions and tt_mb are accepted and ignored, and any
+#wall_selection other than 0 searches only the walls that cut a shortest path.
+import threading
+import time
+import warnings
+
+from board import Board, WALL_EDGES, encode_move, decode_move
+
+SPEED_RATIO = 60 #roughly how many times faster bot_cpp completes a depth 3 search (benchmark.py reports it)
+WIN_SCORE = 100
+SOLVED_SCORE = 99 #scores beyond this are won or lost positions
+INFINITY = 999
+
+warnings.warn(f"Using the pure Python engine, which searches about {SPEED_RATIO}x slower than bot_cpp. "
+              "Build bot_cpp with: python setup.py build_ext --inplace", RuntimeWarning, stacklevel=2)
+
+#Zobrist keys, generated exactly as bot_cpp generates them (splitmix64 from the same seed) so hashes agree
+def _zobrist_keys():
+    state = 0x51A0C1D0B07
+    mask = (1 << 64) - 1
+    keys = []
+    for _ in range(2 * 81 + 2 * 64 + 2 * 11 + 1):
+        state = (state + 0x9E3779B97F4A7C15) & mask
+        z = state
+        z = ((z ^ (z >> 30)) * 0xBF58476D1CE4E5B9) & mask
+        z = ((z ^ (z >> 27)) * 0x94D049BB133111EB) & mask
+        keys.append(z ^ (z >> 31))
+    pawn = [keys[0:81], keys[81:162]]
+    wall = {"H": keys[162:226], "V": keys[226:290]}
+    walls_remaining = [keys[290:301], keys[301:312]]
+    return pawn, wall, walls_remaining, keys[312]
+
+PAWN_KEYS, WALL_KEYS, WALLS_REMAINING_KEYS, SIDE_KEY = _zobrist_keys()
+
+def board_hash(board):
+    key = 0
+    for player in range(2):
+        row, col = board.pawns[player]
+        key ^= PAWN_KEYS[player][row * 9 + col] ^ WALLS_REMAINING_KEYS[player][board.walls_remaining[player]]
+    for row, col, orientation in board.walls:
+        key ^= WALL_KEYS[orientation][(row - 1) * 8 + col]
+    if board.current_player == 1:
+        key ^= SIDE_KEY
+    return key
+
+def make_board(pawns, walls, walls_remaining, current_player):
+    #Board from the state exported by Board.export_state_for_bot (wall types 0/1 for "H"/"V").
+    #Raises ValueError for a state that is not on the board, like bot_cpp
+    if len(pawns) != 2 or len(walls_remaining) != 2:
+        raise ValueError("Expected two pawns and two walls_remaining")
+    for player in range(2):
+        if not (0 <= pawns[player][0] < 9 and 0 <= pawns[player][1] < 9 and 0 <= walls_remaining[player] <= 10):
+            raise ValueError(f"Invalid pawn or walls_remaining for player {player}")
+    if current_player not in (0, 1):
+        raise ValueError(f"Invalid current_player: {current_player}")
+
+    board = Board()
+    board.pawns = [tuple(pawns[0]), tuple(pawns[1])]
+    for row, col, wall_type in walls:
+        if wall_type not in (0, 1) or (row, col, "H") not in WALL_EDGES:
+            raise ValueError(f"Invalid wall: {(row, col, wall_type)}")
+        wall = (row, col, "H" if wall_type == 0 else "V")
+        board.walls.add(wall)
+        for edge in WALL_EDGES[wall]:
+            board._blocked[edge] += 1
+    board.walls_remaining = list(walls_remaining)
+    board.current_player = current_player
+    for player in range(2):
+        if board.is_winner(player):
+            board.game_over = True
+            board.winner = player
+    return board
+
+def position_hash(pawns, walls, walls_remaining, current_player):
+    return board_hash(make_board(pawns, walls, walls_remaining, current_player))
+
+class SearchStats:
+    #the fields of bot_cpp.SearchStats. Counters the Python search does not keep stay zero
+    counters_enabled = True
+
+    def __init__(self):
+        self.nodes = 0
+        self.leaf_evaluations = 0
+        self.bfs_calls = 0
+        self.walls_without_bfs = 0
+        self.beta_cutoffs = 0
+        self.tt_hits = 0
+        self.tt_cutoffs = 0
+        self.races_solved = 0
+        self.completed_depth = 0
+        self.threads = 1
+        self.score = 0.0
+        self.seconds = 0.0
+        self.depth_seconds = []
+        self.depth_nodes = []
+        self.principal_variation = []
+
+    @property
+    def nodes_per_second(self):
+        return self.nodes / self.seconds if self.seconds > 0 else 0.0
+
+    def __repr__(self):
+        return f"<SearchStats depth={self.completed_depth} nodes={self.nodes} score={self.score} seconds={self.seconds}>"
+
+class SearchAborted(Exception):
+    pass
+
+def play(board, move):
+    #child position after a move already known to be legal, skipping apply_move's checks
+    child = board.copy()
+    player = child.current_player
+    if len(move) == 2:
+        child.pawns[player] = move
+    else:
+        child.walls.add(move)
+        for edge in WALL_EDGES[move]:
+            child._blocked[edge] += 1
+        child.walls_remaining[player] -= 1
+
+    if child.is_winner(player):
+        child.game_over = True
+        child.winner = player
+    else:
+        child.current_player = 1 - player
+    return child
+
+class Search:
+    def __init__(self, tt, weights, wall_selection, deadline, stop, stats):
+        self.tt = tt
+        self.path_weight, self.wall_weight = weights
+        self.wall_selection = wall_selection
+        self.deadline = deadline #None searches without a clock
+        self.stop = stop #callable, True once the search should end
+        self.stats = stats
+        self.abortable = False #only once a depth is complete is there a move to fall back on
+
+    def evaluate(self, board):
+        self.stats.leaf_evaluations += 1
+        self.stats.bfs_calls += 2
+        distance0 = len(board.shortest_path(0)) - 1
+        distance1 = len(board.shortest_path(1)) - 1
+        return (distance1 - distance0) * self.path_weight + (board.walls_remaining[0] - board.walls_remaining[1]) * self.wall_weight
+
+    def ordered_moves(self, board, tt_move):
+        #transposition table move, then pawn moves, then the walls that cut a shortest path, then the other walls
+        blockers = board.path_blockers() or set()
+        walls = board.legal_wall_moves()
+        cutting = [wall for wall in walls if wall in blockers]
+        if self.wall_selection == 0:
+            cutting += [wall for wall in walls if wall not in blockers]
+        moves = board.legal_pawn_moves() + cutting
+        if tt_move in moves:
+            moves.remove(tt_move)
+            moves.insert(0, tt_move)
+        return moves
+
+    def minimax(self, board, depth, alpha, beta):
+        #(best move, score) with player 1 maximising
+        stats = self.stats
+        stats.nodes += 1
+        if self.abortable and (stats.nodes & 63) == 0:
+            if self.stop() or (self.deadline is not None and time.perf_counter() >= self.deadline):
+                raise SearchAborted
+
+        if board.game_over:
+            return None, WIN_SCORE if board.winner == 0 else -WIN_SCORE
+        if depth == 0:
+            return None, self.evaluate(board)
+
+        key = board_hash(board)
+        entry = self.tt.get(key)
+        tt_move = None
+        alpha_original, beta_original = alpha, beta
+        if entry is not None:
+            stats.tt_hits += 1
+            entry_depth, score, bound, tt_move = entry
+            if entry_depth >= depth:
+                if bound == "exact":
+                    stats.tt_cutoffs += 1
+                    return tt_move, score
+                if bound == "lower":
+                    alpha = max(alpha, score)
+                else:
+                    beta = min(beta, score)
+                if alpha >= beta:
+                    stats.tt_cutoffs += 1
+                    return tt_move, score
+
+        maximising = board.current_player == 0
+        best_move = None
+        best = -INFINITY if maximising else INFINITY
+        for move in self.ordered_moves(board, tt_move):
+            score = self.minimax(play(board, move), depth - 1, alpha, beta)[1]
+            if (maximising and score > best) or (not maximising and score < best):
+                best, best_move = score, move
+            if maximising:
+                alpha = max(alpha, best)
+            else:
+                beta = min(beta, best)
+            if alpha >= beta:
+                stats.beta_cutoffs += 1
+                break
+
+        if best <= alpha_original:
+            bound = "upper"
+        elif best >= beta_original:
+            bound = "lower"
+        else:
+            bound = "exact"
+        self.tt[key] = (depth, best, bound, best_move)
+        return best_move, best
+
+    def principal_variation(self, board, first_move, length):
+        pv = [first_move]
+        board = play(board, first_move)
+        while len(pv) < length and not board.game_over:
+            entry = self.tt.get(board_hash(board))
+            if entry is None or entry[3] is None:
+                break
+            move = entry[3]
+            pv.append(move)
+            board = play(board, move)
+        return pv
+
+class Engine:
+    #bot_cpp.Engine in Python: follows a game by move codes and keeps its transposition table between searches
+    def __init__(self, tt_mb=16):
+        self.board = Board()
+        self.history = []
+        self.tt = {}
+        self.max_entries = self.entries_for(tt_mb)
+        self.weights = None #weights the transposition table scores were searched with
+        self.stop_requested = False
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def entries_for(tt_mb):
+        return max(1, tt_mb) * 4096 #a dict entry with its tuple takes roughly 256 bytes
+
+    def resize(self, tt_mb):
+        with self.lock:
+            self.max_entries = self.entries_for(tt_mb)
+            self.tt.clear()
+
+    #Changing the position drops a stop request meant for a search of the old one. A stop sent after the position is
+    #set, even before the search has started, ends the next search
+    def set_position(self, pawns, walls, walls_remaining, current_player):
+        with self.lock:
+            self.board = make_board(pawns, walls, walls_remaining, current_player)
+            self.history = []
+            self.stop_requested = False
+
+    def reset(self):
+        with self.lock:
+            self.board = Board()
+            self.history = []
+            self.stop_requested = False
+
+    def push(self, move):
+        with self.lock:
+            if self.board.game_over:
+                raise ValueError("The game is over")
+            child = self.board.copy()
+            try:
+                child.apply_move(decode_move(move))
+            except (ValueError, IndexError):
+                raise ValueError(f"Illegal move code: {move}")
+            self.history.append(self.board)
+            self.board = child
+            self.stop_requested = False
+
+    def pop(self):
+        with self.lock:
+            if not self.history:
+                raise IndexError("No move to pop")
+            self.board = self.history.pop()
+            self.stop_requested = False
+
+    def search(self, max_depth, time_ms=0, threads=1, path_weight=1.0, wall_weight=0.2, wall_selection=0,
+               late_move_reductions=False, return_stats=False):
+        if wall_selection not in (0, 1, 2):
+            raise ValueError("wall_selection must be 0 (all), 1 (reduce) or 2 (prune)")
+        with self.lock:
+            move, stats = self.run_search(max_depth, time_ms, (path_weight, wall_weight), wall_selection)
+            self.stop_requested = False #used up by this search
+        code = encode_move(move)
+        return (code, stats) if return_stats else code
+
+    def run_search(self, max_depth, time_ms, weights, wall_selection):
+        if weights != self.weights or len(self.tt) > self.max_entries:
+            self.tt.clear()
+            self.weights = weights
+
+        stats = SearchStats()
+        start = time.perf_counter()
+        deadline = start + time_ms / 1000 if time_ms > 0 else None
+        search = Search(self.tt, weights, wall_selection, deadline, lambda: self.stop_requested, stats)
+        board = self.board
+        best = (None, 0.0)
+
+        for depth in range(1, max_depth + 1):
+            iteration_start = time.perf_counter()
+            try:
+                result = search.minimax(board, depth, -INFINITY, INFINITY)
+            except SearchAborted:
+                break
+            if result[0] is None: #the game is over, there is no move to make
+                break
+            best = result
+            search.abortable = True
+            stats.completed_depth = depth
+            stats.depth_seconds.append(time.perf_counter() - iteration_start)
+            stats.depth_nodes.append(stats.nodes)
+
+            if deadline is not None and (time.perf_counter() - start) * 2 >= time_ms / 1000:
+                break #the next iteration takes several times longer so dont start it past half the budget
+            if abs(best[1]) >= SOLVED_SCORE:
+                break
+
+        move = best[0]
+        if move is None: #no completed depth (or a finished game): any legal move
+            moves = board.legal_pawn_moves()
+            move = moves[0] if moves else (0, 0)
+        stats.score = best[1]
+        stats.seconds = time.perf_counter() - start
+        if stats.completed_depth:
+            stats.principal_variation = search.principal_variation(board, move, stats.completed_depth)
+        return move, stats
+
+    def stop(self):
+        #end a running search (from another thread) with the best move found so far, or the next one if it has not
+        #started yet
+        self.stop_requested = True
+
+    def clear(self):
+        with self.lock:
+            self.tt.clear()
+
+    def legal_moves(self):
+        board = self.board
+        if board.game_over:
+            return []
+        return [encode_move(move) for move in board.legal_pawn_moves() + board.legal_wall_moves()]
+
+    @property
+    def hash(self):
+        return board_hash(self.board)
+
+    @property
+    def current_player(self):
+        return self.board.current_player
+
+    @property
+    def ply(self):
+        return len(self.history)
+
+#Search state kept between bot_main calls
+default_engine = Engine(16)
+
+def bot_main(pawns, walls, walls_remaining, current_player, max_depth, tt_mb=16, time_ms=0, threads=1,
+             path_weight=1.0, wall_weight=0.2, wall_selection=0, late_move_reductions=False, return_stats=False):
+    with default_engine.lock: #not set_position, so a stop_search sent before the search starts still ends it, as in bot_cpp
+        default_engine.board = make_board(pawns, walls, walls_remaining, current_player)
+        default_engine.history = []
+    code, stats = default_engine.search(max_depth, time_ms=time_ms, path_weight=path_weight, wall_weight=wall_weight,
+                                        wall_selection=wall_selection, return_stats=True)
+    move = decode_move(code)
+    return (move, stats) if return_stats else move
+
+def stop_search():
+    default_engine.stop()
+
+def clear_tt():
+    default_engine.clear()
@@ -1,16 +1,65 @@
+#Build the engine next to the Python files with
+#   python setup.py build_ext --inplace
+#Options are environment variables:
+#   BOT_NO_STATS=1     compile the search profiling counters out of production builds
+#   BOT_PORTABLE=1     dont tune for this machine's CPU (-march=native on Linux), for binaries copied to other machines
+#   BOT_PGO=generate   profile guided optimisation with GCC or Clang, step 1: an instrumented build. Then run a
+#                      typical workload (e.g. python benchmark.py) to record a profile in pgo-data/ and
+#   BOT_PGO=use        step 2: rebuild with --force using the profile. With Clang first merge it:
+#                      llvm-profdata merge -o pgo-data/default.profdata pgo-data
+import os
+import sys
 from setuptools import setup
 from pybind11.setup_helpers import Pybind11Extension, build_ext
 
+PGO_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "pgo-data")
+
+define_macros = [("BOT_NO_STATS", "1")] if os.environ.get("BOT_NO_STATS") else []
+
+def optimisation_flags(compiler):
+    #(compile args, link args) for the compiler setuptools picked
+    if compiler.compiler_type == "msvc":
+        return ["/O2"], []
+
+    is_clang = "clang" in os.path.basename(compiler.compiler_so[0])
+    compile_args = ["-O3", "-fno-plt", "-g0"] #the search is CPU bound, so optimise as hard as is safe. -g0 overrides Python's -g
+    if sys.platform.startswith("linux") and not os.environ.get("BOT_PORTABLE"):
+        compile_args.append("-march=native")
+    link_args = []
+
+    pgo = os.environ.get("BOT_PGO")
+    if pgo == "generate":
+        compile_args.append(f"-fprofile-generate={PGO_DIR}")
+        link_args.append(f"-fprofile-generate={PGO_DIR}")
+    elif pgo == "use":
+        compile_args.append(f"-fprofile-use={PGO_DIR}")
+        if not is_clang:
+            compile_args += ["-fprofile-correction", "-Wno-missing-profile"] #profiles from threaded searches are slightly inconsistent
+        link_args.append(f"-fprofile-use={PGO_DIR}")
+    elif pgo:
+        raise SystemExit(f"BOT_PGO must be generate or use, not {pgo}")
+    return compile_args, link_args
+
+class BotBuildExt(build_ext):
+    #the flags depend on the compiler, which is only known once the build starts
+    def build_extensions(self):
+        compile_args, link_args = optimisation_flags(self.compiler)
+        for extension in self.extensions:
+            extension.extra_compile_args += compile_args
+            extension.extra_link_args += link_args
+        super().build_extensions()
+
 ext_modules = [
     Pybind11Extension(
         "bot_cpp",                 # module name
         ["bot.cpp"],            # source file
-        extra_compile_args=["/O2"], # MSVC optimization
+        cxx_std=17,
+        define_macros=define_macros,
     ),
 ]
 
 setup(
     name="bot_cpp",
     ext_modules=ext_modules,
-    cmdclass={"build_ext": build_ext},
+    cmdclass={"build_ext": BotBuildExt},
 )
@@ -0,0 +1,186 @@
+#Headless self-play tournament between two bot configurations
+#Games are refereed by board.Board and spread over a process pool, e.g.
+#   python tournament.py --games 1000 --engine-a depth=3 --engine-b depth=3,walls=0.3 --processes 16
+#--record games.qgr appends every game to a game record file (see game_record.py)
+import argparse
+import json
+import math
+import multiprocessing
+import random
+import time
+
+from board import Board
+try:
+    from bot_cpp import bot_main, clear_tt
+except ImportError: #bot_cpp is not built for this platform
+    from python_engine import bot_main, clear_tt
+from game_record import GameWriter
+
+#Engine options and their defaults. depth is the maximum depth, time the budget per move in ms (0 = fixed depth),
+#tt the transposition table size in MB, path/walls the evaluation weights and select the wall selection mode
+#(0 every wall, 1 irrelevant walls searched shallower, 2 irrelevant walls pruned) and lmr 1 for late move reductions
+ENGINE_DEFAULTS = {"depth": 3, "time": 0, "threads": 1, "tt": 16, "path": 1.0, "walls": 0.2, "select": 0, "lmr": 0}
+
+def parse_engine(spec):
+    #turn "depth=4,time=500,walls=0.3" into a full engine config
+    config = dict(ENGINE_DEFAULTS)
+    for item in spec.split(","):
+        if not item.strip():
+            continue
+        key, _, value = item.partition("=")
+        key = key.strip()
+        if key not in config:
+            raise argparse.ArgumentTypeError(f"Unknown engine option: {key}")
+        try:
+            config[key] = type(ENGINE_DEFAULTS[key])(value)
+        except ValueError:
+            raise argparse.ArgumentTypeError(f"Invalid value for {key}: {value}")
+    return config
+
+def engine_move(board, config):
+    clear_tt() #search every move from scratch so neither engine benefits from the other's search
+    return bot_main(*board.export_state_for_bot(), config["depth"],
+                    tt_mb=config["tt"], time_ms=config["time"], threads=config["threads"],
+                    path_weight=config["path"], wall_weight=config["walls"], wall_selection=config["select"],
+                    late_move_reductions=bool(config["lmr"]))
+
+def play_game(task):
+    #play one game and return its result. Engine A plays player 0 in even games and player 1 in odd games
+    game_index, engines, random_plies, max_plies, seed = task
+    a_player = game_index % 2
+    rng = random.Random(f"{seed}-{game_index}")
+    board = Board()
+
+    result = {"game": game_index, "a_player": a_player, "winner": None, "plies": 0, "illegal": None,
+              "move_time": [0.0, 0.0], "moves": [0, 0]} #[engine A, engine B]
+    played = []
+    result["record"] = (played, None) #moves and winning player, taken out by run_tournament
+
+    while not board.game_over and result["plies"] < max_plies:
+        if result["plies"] < random_plies:
+            #random pawn moves to open so deterministic engines dont replay the same game
+            move = rng.choice(board.legal_pawn_moves())
+            board.apply_move(move)
+            played.append(move)
+            result["plies"] += 1
+            continue
+
+        engine = 0 if board.current_player == a_player else 1
+        start = time.perf_counter()
+        move = engine_move(board, engines[engine])
+        result["move_time"][engine] += time.perf_counter() - start
+        result["moves"][engine] += 1
+        result["plies"] += 1
+
+        try:
+            board.apply_move(move)
+            played.append(move)
+        except ValueError:
+            result["illegal"] = "AB"[engine]
+            result["winner"] = "AB"[1 - engine] #an illegal move loses the game
+            return result
+
+    if board.game_over:
+        result["winner"] = "A" if board.winner == a_player else "B"
+        result["record"] = (played, board.winner)
+    return result #winner None is a draw (max_plies reached)
+
+def summarise(results, engines, elapsed):
+    games = len(results)
+    a_wins = sum(1 for r in results if r["winner"] == "A")
+    b_wins = sum(1 for r in results if r["winner"] == "B")
+    draws = games - a_wins - b_wins
+    score = (a_wins + 0.5 * draws) / games if games else 0.0
+
+    #Elo difference of A over B implied by the score (undefined at 0% or 100%)
+    elo = None
+    if 0 < score < 1:
+        elo = -400 * math.log10(1 / score - 1)
+
+    summary = {
+        "engine_a": engines[0],
+        "engine_b": engines[1],
+        "games": games,
+        "a_wins": a_wins,
+        "b_wins": b_wins,
+        "draws": draws,
+        "a_score": score,
+        "elo_a_minus_b": elo,
+        "illegal_moves": {"A": sum(1 for r in results if r["illegal"] == "A"),
+                          "B": sum(1 for r in results if r["illegal"] == "B")},
+        "a_wins_as_player": [sum(1 for r in results if r["winner"] == "A" and r["a_player"] == p) for p in range(2)],
+        "average_plies": sum(r["plies"] for r in results) / games if games else 0.0,
+        "elapsed_s": elapsed,
+        "games_per_s": games / elapsed if elapsed > 0 else 0.0,
+    }
+    for engine, name in enumerate("ab"):
+        moves = sum(r["moves"][engine] for r in results)
+        seconds = sum(r["move_time"][engine] for r in results)
+        summary[f"{name}_average_move_ms"] = 1000 * seconds / moves if moves else 0.0
+    return summary
+
+def run_tournament(engines, games, processes=None, random_plies=2, max_plies=200, seed=0, progress=None, record_path=None):
+    tasks = [(game, engines, random_plies, max_plies, seed) for game in range(games)]
+    results = []
+    writer = GameWriter(record_path) if record_path else None
+
+    start = time.perf_counter()
+    with multiprocessing.Pool(processes) as pool:
+        for result in pool.imap_unordered(play_game, tasks):
+            moves, winner = result.pop("record")
+            if writer:
+                writer.write_game(moves, winner)
+            results.append(result)
+            if progress:
+                progress(result, len(results), games)
+    elapsed = time.perf_counter() - start
+    if writer:
+        writer.close()
+
+    results.sort(key=lambda r: r["game"])
+    return summarise(results, engines, elapsed), results
+
+def print_summary(summary):
+    print(f"Engine A: {summary['engine_a']}")
+    print(f"Engine B: {summary['engine_b']}")
+    print(f"Games: {summary['games']}  A wins: {summary['a_wins']}  B wins: {summary['b_wins']}  Draws: {summary['draws']}")
+    elo = summary["elo_a_minus_b"]
+    elo_text = f"{elo:+.0f}" if elo is not None else "n/a"
+    print(f"A score: {100 * summary['a_score']:.1f}%  (Elo A-B: {elo_text})")
+    print(f"A wins as player 1 / player 2: {summary['a_wins_as_player'][0]} / {summary['a_wins_as_player'][1]}")
+    if summary["illegal_moves"]["A"] or summary["illegal_moves"]["B"]:
+        print(f"Illegal moves: A {summary['illegal_moves']['A']}, B {summary['illegal_moves']['B']}")
+    print(f"Average move time: A {summary['a_average_move_ms']:.1f} ms, B {summary['b_average_move_ms']:.1f} ms")
+    print(f"Average game length: {summary['average_plies']:.1f} plies")
+    print(f"Elapsed: {summary['elapsed_s']:.1f} s  ({summary['games_per_s']:.2f} games/s)")
+
+def main():
+    parser = argparse.ArgumentParser(description="Play bot-vs-bot games between two engine configurations")
+    parser.add_argument("--engine-a", type=parse_engine, default=parse_engine(""),
+                        help="options for engine A, e.g. depth=4,time=500,threads=1,tt=16,path=1.0,walls=0.2,select=0,lmr=0")
+    parser.add_argument("--engine-b", type=parse_engine, default=parse_engine(""), help="options for engine B")
+    parser.add_argument("--games", type=int, default=100)
+    parser.add_argument("--processes", type=int, default=None, help="worker processes (default: one per core)")
+    parser.add_argument("--random-plies", type=int, default=2, help="random opening pawn moves per game")
+    parser.add_argument("--max-plies", type=int, default=200, help="games longer than this are drawn")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="also write the summary and per game results to this file")
+    parser.add_argument("--record", help="append every game to this game record file")
+    parser.add_argument("--quiet", action="store_true", help="dont print a line per finished game")
+    args = parser.parse_args()
+
+    def progress(result, done, total):
+        winner = result["winner"] or "draw"
+        print(f"[{done}/{total}] game {result['game']}: {winner} in {result['plies']} plies", flush=True)
+
+    summary, results = run_tournament([args.engine_a, args.engine_b], args.games, args.processes,
+                                      args.random_plies, args.max_plies, args.seed,
+                                      None if args.quiet else progress, args.record)
+    print_summary(summary)
+
+    if args.json:
+        with open(args.json, "w") as file:
+            json.dump({"summary": summary, "games": results}, file, indent=2)
+
+if __name__ == "__main__":
+    main()